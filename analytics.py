@@ -0,0 +1,221 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from pipeline import CLASSES
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    stream TEXT NOT NULL,
+    bucket_start REAL NOT NULL,
+    class_id INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    frames INTEGER NOT NULL,
+    detections INTEGER NOT NULL,
+    max_count INTEGER NOT NULL,
+    PRIMARY KEY (stream, bucket_start, class_id)
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    stream TEXT NOT NULL,
+    track_id INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    class_id INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    last_seen REAL NOT NULL,
+    detections INTEGER NOT NULL,
+    PRIMARY KEY (stream, track_id, first_seen)
+);
+"""
+
+# Buckets already written are merged with later rows for the same bucket instead of replacing them
+UPSERT_BUCKET = """
+INSERT INTO buckets VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (stream, bucket_start, class_id) DO UPDATE SET
+    frames = frames + excluded.frames,
+    detections = detections + excluded.detections,
+    max_count = max(max_count, excluded.max_count)
+"""
+UPSERT_TRACK = """
+INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (stream, track_id, first_seen) DO UPDATE SET
+    last_seen = excluded.last_seen,
+    detections = excluded.detections
+"""
+
+
+class AnalyticsSink:
+    # Per-stream detection analytics in a local SQLite file. record() only enqueues, and drops the event when
+    # the queue is full, so a stream callback never waits on the aggregator or on disk. A background thread
+    # folds events into bucket_seconds buckets of per-class counts and into per-track first/last sightings,
+    # and every flush_seconds writes the finished buckets and ended tracks in one transaction.
+    def __init__(self, path, bucket_seconds=10, flush_seconds=5, track_timeout=5, max_queued=10000, labels=CLASSES, metrics=None):
+        self.path = path
+        self.bucket_seconds = bucket_seconds
+        self.flush_seconds = flush_seconds
+        self.track_timeout = track_timeout
+        self.labels = labels
+        self.metrics = metrics
+        self.dropped = 0
+        self.buckets_written = 0
+        self.tracks_written = 0
+        self.flushes = 0
+        self.errors = 0
+        self.aggregate_errors = 0
+        self._events = queue.Queue(max_queued)
+        # (stream, bucket_start) -> [frames, per-class detections, per-class max count]
+        self._buckets = {}
+        # (stream, tracker, track_id) -> [first_seen, class_id, last_seen, detections]
+        self._tracks = {}
+        self._closed = threading.Event()
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+        self._thread = threading.Thread(target=self._run, name="analytics-sink", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def record(self, stream, boxes, timestamp=None, tracker=None):
+        # boxes: DETECTION_DTYPE array of one frame, after tracking. tracker names the tracker that assigned the
+        # track IDs, so IDs restarting in another tracker of the same stream are not merged with earlier tracks.
+        event = (stream, time.time() if timestamp is None else timestamp, boxes["class_id"].copy(), boxes["track_id"].copy(), tracker)
+        try:
+            self._events.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            if self.metrics is not None:
+                self.metrics.increment("analytics_dropped")
+
+    def _aggregate(self, stream, timestamp, class_ids, track_ids, tracker):
+        bucket_start = timestamp - timestamp % self.bucket_seconds
+        bucket = self._buckets.get((stream, bucket_start))
+        if bucket is None:
+            num_classes = len(self.labels)
+            bucket = self._buckets[(stream, bucket_start)] = [0, np.zeros(num_classes, dtype=np.int64), np.zeros(num_classes, dtype=np.int64)]
+        counts = np.bincount(class_ids, minlength=len(bucket[1]))
+        bucket[1] += counts
+        np.maximum(bucket[2], counts, out=bucket[2])
+        bucket[0] += 1
+        for class_id, track_id in zip(class_ids.tolist(), track_ids.tolist()):
+            if track_id < 0:
+                continue
+            track = self._tracks.get((stream, tracker, track_id))
+            if track is None:
+                self._tracks[(stream, tracker, track_id)] = [timestamp, class_id, timestamp, 1]
+            else:
+                track[2] = timestamp
+                track[3] += 1
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_seconds
+        while True:
+            try:
+                event = self._events.get(timeout=max(next_flush - time.monotonic(), 0))
+            except queue.Empty:
+                event = None
+            if event is not None:
+                try:
+                    self._aggregate(*event)
+                except Exception:
+                    # A bad event, e.g. class ids outside labels, is dropped instead of ending the thread
+                    self.aggregate_errors += 1
+                    if self.metrics is not None:
+                        self.metrics.increment("analytics_aggregate_errors")
+                    logger.exception("Dropped analytics event of stream %s", event[0])
+            closing = self._closed.is_set() and self._events.empty()
+            if closing or time.monotonic() >= next_flush:
+                self._flush(everything=closing)
+                next_flush = time.monotonic() + self.flush_seconds
+            if closing:
+                return
+
+    def _flush(self, everything=False):
+        now = time.time()
+        buckets = [key for key in self._buckets if everything or key[1] + self.bucket_seconds <= now]
+        ended = [key for key, track in self._tracks.items() if everything or track[2] + self.track_timeout <= now]
+        bucket_rows = []
+        for stream, bucket_start in buckets:
+            frames, detections, max_counts = self._buckets.pop((stream, bucket_start))
+            for class_id in np.flatnonzero(detections).tolist():
+                bucket_rows.append((stream, bucket_start, class_id, self.labels[class_id], frames, int(detections[class_id]), int(max_counts[class_id])))
+        track_rows = []
+        for stream, tracker, track_id in ended:
+            first_seen, class_id, last_seen, detections = self._tracks.pop((stream, tracker, track_id))
+            track_rows.append((stream, track_id, first_seen, class_id, self.labels[class_id], last_seen, detections))
+        if not bucket_rows and not track_rows:
+            return
+        start = time.perf_counter()
+        try:
+            with self._connect() as connection:
+                connection.executemany(UPSERT_BUCKET, bucket_rows)
+                connection.executemany(UPSERT_TRACK, track_rows)
+        except sqlite3.Error:
+            self.errors += 1
+            if self.metrics is not None:
+                self.metrics.increment("analytics_write_errors")
+            return
+        self.buckets_written += len(bucket_rows)
+        self.tracks_written += len(track_rows)
+        self.flushes += 1
+        if self.metrics is not None:
+            self.metrics.observe("analytics_flush", time.perf_counter() - start)
+            self.metrics.increment("analytics_rows_written", len(bucket_rows) + len(track_rows))
+
+    def close(self, timeout=None):
+        # Writes everything still in memory, including open buckets and tracks.
+        self._closed.set()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "analytics_queued": self._events.qsize(),
+            "analytics_dropped": self.dropped,
+            "analytics_open_buckets": len(self._buckets),
+            "analytics_open_tracks": len(self._tracks),
+            "analytics_buckets_written": self.buckets_written,
+            "analytics_tracks_written": self.tracks_written,
+            "analytics_flushes": self.flushes,
+            "analytics_write_errors": self.errors,
+            "analytics_aggregate_errors": self.aggregate_errors,
+        }
+
+    def streams(self):
+        with self._connect() as connection:
+            return [stream for stream, in connection.execute("SELECT DISTINCT stream FROM buckets ORDER BY stream")]
+
+    def query(self, sql, parameters=()):
+        # Returns {column: [values]}; aggregates still in memory are not included until their flush.
+        with self._connect() as connection:
+            cursor = connection.execute(sql, parameters)
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
+        return {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+
+    def counts_over_time(self, since, stream=None):
+        # Mean objects per frame of each class and bucket.
+        return self.query(
+            "SELECT datetime(bucket_start, 'unixepoch', 'localtime') AS time, label, SUM(detections) * 1.0 / SUM(frames) AS objects_per_frame"
+            " FROM buckets WHERE bucket_start >= ? AND (? IS NULL OR stream = ?) GROUP BY bucket_start, label ORDER BY bucket_start",
+            (since, stream, stream),
+        )
+
+    def class_histogram(self, since, stream=None):
+        return self.query(
+            "SELECT label, SUM(detections) AS detections, MAX(max_count) AS max_in_frame FROM buckets"
+            " WHERE bucket_start >= ? AND (? IS NULL OR stream = ?) GROUP BY label ORDER BY detections DESC",
+            (since, stream, stream),
+        )
+
+    def dwell_times(self, since, stream=None):
+        # Per-class time tracked objects stayed in view, from their first to their last sighting.
+        return self.query(
+            "SELECT label, COUNT(*) AS tracks, AVG(last_seen - first_seen) AS mean_dwell_s, MAX(last_seen - first_seen) AS max_dwell_s FROM tracks"
+            " WHERE last_seen >= ? AND (? IS NULL OR stream = ?) GROUP BY label ORDER BY tracks DESC",
+            (since, stream, stream),
+        )
@@ -1,71 +1,182 @@
 import streamlit as st
 from streamlit_webrtc import WebRtcMode, webrtc_streamer
-import numpy as np
 import pathlib
+import atexit
 import base64
-import cv2
 import av
-import matplotlib.colors as clr
-import queue
+import io
+import os
+import time
+import uuid
+import weakref
 from pathlib import Path
-from typing import List, NamedTuple
+from collections import Counter
+from typing import List
+
+from analytics import AnalyticsSink
+from backends import available_backends, compute_options, get_backend
+from batch import IMAGE_EXTENSIONS, ResultWriter, detect_images
+from detector import DetectorPool, InferenceScheduler
+from frame_ring import FrameRing
+from metrics import Metrics, serve_metrics
+from motion import MotionGate, MotionScore
+from result_cache import DetectionCache
+from roi import RegionOfInterest, parse_polygons
+from ssd import SSDDecoder
+from pipeline import Detection, DetectionRenderer, class_limits, decode_detections, label_colors, to_detections
+from streaming import KeyframePolicy, LatencyGovernor, ResultChannel, StreamGate
+from tiling import Tiler, TiledRequest
+from tracking import Tracker
 
 st.set_page_config(page_title="Object Recognition Playground", page_icon="images/oxbrain_favicon.png", layout="wide")
 
 st.elements.utils._shown_default_value_warning=True
 
-CLASSES = [
-    "background",
-    "aeroplane",
-    "bicycle",
-    "bird",
-    "boat",
-    "bottle",
-    "bus",
-    "car",
-    "cat",
-    "chair",
-    "cow",
-    "diningtable",
-    "dog",
-    "horse",
-    "motorbike",
-    "person",
-    "pottedplant",
-    "sheep",
-    "sofa",
-    "train",
-    "tvmonitor",
-]
-
 @st.cache_resource  # type: ignore
-def generate_label_colors():
-    color1 = "#5007E3"
-    color2 = "#03A9F4"
-    col_cmap = clr.LinearSegmentedColormap.from_list(name="", colors=[color1, color2])
-    num_classes = len(CLASSES)
-    values = np.linspace(0, 1, num_classes)
-    colors = col_cmap(values)
-    label_colors = (colors[:, :3][:, ::-1] * 255)
-    return label_colors
-
-COLORS = generate_label_colors()
-
-class Detection(NamedTuple):
-    class_id: int
-    label: str
-    score: float
-    box: np.ndarray
+def get_detection_renderer(backend_name):
+    labels = get_backend(backend_name).labels
+    return DetectionRenderer(label_colors(len(labels)), labels)
+
 
 DEFAULT_CONFIDENCE_THRESHOLD = 0.5
-MODEL = "model/MobileNetSSD_deploy.caffemodel"
-PROTOTXT = "model/MobileNetSSD_deploy.prototxt.txt"
+# Registered name of the detector selected when a session starts, see backends.py
+DETECTOR_BACKEND = os.environ.get("DETECTOR_BACKEND", "caffe-ssd")
+DETECTOR_POOL_SIZE = int(os.environ.get("DETECTOR_POOL_SIZE", 2))
+INFERENCE_MAX_BATCH = int(os.environ.get("INFERENCE_MAX_BATCH", 8))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get("INFERENCE_MAX_WAIT_MS", 10))
+# "thread" runs forward passes on the shared DetectorPool, "process" in INFERENCE_WORKERS worker processes
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "thread")
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", os.cpu_count() or 1))
+FRAME_WAIT_MS = float(os.environ.get("FRAME_WAIT_MS", 100))
+# Decoded frames live in fixed-size slots; the process backend shares FRAME_RING_SLOTS of them with its workers
+FRAME_SLOT_BYTES = int(os.environ.get("FRAME_SLOT_MAX_PIXELS", 1920 * 1080)) * 3
+FRAME_RING_SLOTS = int(os.environ.get("FRAME_RING_SLOTS", 24))
+RESULT_BUFFER_SIZE = int(os.environ.get("RESULT_BUFFER_SIZE", 30))
+METRICS_PORT = os.environ.get("METRICS_PORT")
+# Detection results reused for identical inputs; RESULT_CACHE_SIZE=0 turns the cache off.
+# A non-zero RESULT_CACHE_TOLERANCE matches frames by a quantised thumbnail instead of their exact bytes.
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 256))
+RESULT_CACHE_TTL_S = float(os.environ.get("RESULT_CACHE_TTL_S", 30))
+RESULT_CACHE_TOLERANCE = int(os.environ.get("RESULT_CACHE_TOLERANCE", 0))
+# Annotated uploads shown on the page; every upload is still included in the downloadable results
+BATCH_PREVIEW_IMAGES = int(os.environ.get("BATCH_PREVIEW_IMAGES", 12))
+# Per-frame latency the adaptive quality governor steers each stream towards
+GOVERNOR_TARGET_MS = float(os.environ.get("GOVERNOR_TARGET_MS", 60))
+# SQLite file that per-stream detection analytics are written to; unset turns analytics off
+ANALYTICS_DB = os.environ.get("ANALYTICS_DB")
+ANALYTICS_BUCKET_S = float(os.environ.get("ANALYTICS_BUCKET_S", 10))
+ANALYTICS_FLUSH_S = float(os.environ.get("ANALYTICS_FLUSH_S", 5))
+# Most forwards per frame in tiled mode, including the full-frame pass
+TILE_BUDGET = int(os.environ.get("TILE_BUDGET", 7))
+# How long a page waits for the detector to load and warm up before offering the camera anyway
+WARMUP_TIMEOUT_S = float(os.environ.get("WARMUP_TIMEOUT_S", 60))
+
+
+@st.cache_resource  # type: ignore
+def get_process_metrics():
+    metrics = Metrics()
+    if METRICS_PORT:
+        # Prometheus text on /metrics, JSON on /metrics.json
+        serve_metrics(metrics, int(METRICS_PORT))
+    return metrics
+
+
+@st.cache_resource  # type: ignore
+def get_detector_pool(backend_name, dnn_backend, dnn_target):
+    return DetectorPool(get_backend(backend_name).on(dnn_backend, dnn_target), size=DETECTOR_POOL_SIZE)
+
+
+@st.cache_resource  # type: ignore
+def get_frame_ring():
+    return FrameRing(FRAME_RING_SLOTS, FRAME_SLOT_BYTES, shared=True)
+
+
+def new_stream_frames():
+    if INFERENCE_BACKEND == "process":
+        return get_frame_ring().stream()
+    return FrameRing(3, FRAME_SLOT_BYTES).stream()
+
+
+@st.cache_resource  # type: ignore
+def get_inference_scheduler(backend_name, compute):
+    # One scheduler per detector and compute target, so sessions on different detectors batch separately.
+    metrics = get_process_metrics()
+    dnn_backend, dnn_target = compute_options()[compute]
+    labels = {"backend": backend_name, "compute": compute}
+    if INFERENCE_BACKEND == "process":
+        # Only the process backend needs multiprocessing and shared memory
+        from process_scheduler import ProcessScheduler
+
+        frame_ring = get_frame_ring()
+        scheduler = ProcessScheduler(get_backend(backend_name).on(dnn_backend, dnn_target), workers=INFERENCE_WORKERS, max_batch=INFERENCE_MAX_BATCH, max_wait_ms=INFERENCE_MAX_WAIT_MS, frame_ring=frame_ring, metrics=metrics)
+        metrics.gauge("inference_workers_ready", lambda: scheduler.workers_ready, labels)
+        metrics.gauge("frame_slots_available", lambda: frame_ring.available)
+    else:
+        pool = get_detector_pool(backend_name, dnn_backend, dnn_target)
+        scheduler = InferenceScheduler(pool, max_batch=INFERENCE_MAX_BATCH, max_wait_ms=INFERENCE_MAX_WAIT_MS, metrics=metrics)
+        metrics.gauge("detector_nets_loaded", lambda: pool.loaded, labels)
+    metrics.gauge("scheduler_pending", lambda: scheduler.pending, labels)
+    metrics.gauge("detector_ready", lambda: int(scheduler.ready), labels)
+    # Cold minus warm forward latency, i.e. what the warm-up saves the first stream
+    metrics.gauge("warmup_gap_ms", lambda: round(scheduler.warmup["cold_forward_ms"] - scheduler.warmup["warm_forward_ms"], 1) if scheduler.warmup else 0, labels)
+    return scheduler
+
+
+@st.cache_resource  # type: ignore
+def get_result_cache():
+    metrics = get_process_metrics()
+    cache = DetectionCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL_S, tolerance=RESULT_CACHE_TOLERANCE, metrics=metrics)
+    metrics.gauge("result_cache_entries", lambda: len(cache))
+    return cache
+
+
+@st.cache_resource  # type: ignore
+def get_analytics_sink(labels):
+    # labels: class names of the detector, a tuple so it can key the cache
+    if not ANALYTICS_DB:
+        return None
+    metrics = get_process_metrics()
+    sink = AnalyticsSink(ANALYTICS_DB, bucket_seconds=ANALYTICS_BUCKET_S, flush_seconds=ANALYTICS_FLUSH_S, labels=labels, metrics=metrics)
+    # Writes the open buckets and tracks when the server stops
+    atexit.register(sink.close)
+    metrics.gauge("analytics_queued", lambda: sink.stats()["analytics_queued"])
+    return sink
+
+
+@st.cache_resource  # type: ignore
+def get_live_streams():
+    # Session registries only forward samples and counts, so per-stream state is summarised across the
+    # sessions still alive here. Entries go away with their session state.
+    metrics = get_process_metrics()
+    governors, regions = weakref.WeakSet(), weakref.WeakSet()
+    metrics.gauge("governor_streams_degraded", lambda: sum(governor.level > 0 for governor in list(governors)))
+    metrics.gauge("governor_level_max", lambda: max((governor.level for governor in list(governors)), default=0))
+    metrics.gauge("governor_frame_scale_min", lambda: min((governor.scale for governor in list(governors)), default=1))
+    metrics.gauge("governor_detect_every_max", lambda: max((governor.interval for governor in list(governors)), default=1))
+    metrics.gauge("governor_frame_stride_max", lambda: max((governor.stride for governor in list(governors)), default=1))
+
+    def roi_area_fraction_mean():
+        fractions = [roi.area_fraction() for roi in list(regions)]
+        return round(sum(fractions) / len(fractions), 4) if fractions else 1.0
+
+    metrics.gauge("roi_area_fraction_mean", roi_area_fraction_mean)
+    return governors, regions
+
+
+def get_session_object(key, factory):
+    if key not in st.session_state:
+        st.session_state[key] = factory()
+    return st.session_state[key]
+
+
+@st.cache_resource(max_entries=16)  # type: ignore
+def read_encoded_asset(path, mtime):
+    # mtime is only part of the cache key, so an asset replaced on disk is encoded again on the next run.
+    return base64.b64encode(pathlib.Path(path).read_bytes()).decode()
 
 
 def img_to_bytes(img_path):
-    img_bytes = pathlib.Path(img_path).read_bytes()
-    encoded = base64.b64encode(img_bytes).decode()
-    return encoded
+    return read_encoded_asset(img_path, os.path.getmtime(img_path))
 
 
 marker_spinner_css = """
@@ -818,10 +929,8 @@ header = """
 
 # Replace `image_file_path` with the actual path to your image file
 image_file_path = "images/oxbrain_header_background.jpg"
-with open(image_file_path, "rb") as image_file:
-    encoded_string = base64.b64encode(image_file.read()).decode()
 
-st.markdown(header.format(encoded_string, img_to_bytes("images/oxbrain_logo_trans.png")),
+st.markdown(header.format(img_to_bytes(image_file_path), img_to_bytes("images/oxbrain_logo_trans.png")),
             unsafe_allow_html=True)
 
 spinner = st.empty()
@@ -850,12 +959,32 @@ with col2:
 
 col1, col2, col3 = st.columns([2, 4, 2])
 with col2:
-    cache_key = "object_detection_dnn"
-    if cache_key in st.session_state:
-        net = st.session_state[cache_key]
-    else:
-        net = cv2.dnn.readNetFromCaffe(PROTOTXT, MODEL)
-        st.session_state[cache_key] = net
+    backends = {backend.title: backend for backend in available_backends()}
+    default_backend = next((i for i, backend in enumerate(backends.values()) if backend.name == DETECTOR_BACKEND), 0)
+    backend = backends[st.selectbox("Detector", list(backends), index=default_backend, help="Networks whose model files are present under model/. Each detector has its own inference queue.")]
+    computes = compute_options()
+    compute = st.selectbox("Compute", list(computes), help="OpenCV DNN backend and target combinations this build can run on the CPU.")
+    scheduler = get_inference_scheduler(backend.name, compute)
+    result_cache = get_result_cache()
+    model_id = f"{backend.name}/{compute}"
+    renderer = get_detection_renderer(backend.name)
+    process_metrics = get_process_metrics()
+    session_metrics = get_session_object("object_detection_metrics", lambda: Metrics(parent=process_metrics))
+    gate = get_session_object("object_detection_gate", lambda: StreamGate(wait_ms=FRAME_WAIT_MS, metrics=session_metrics))
+    result_channel = get_session_object("object_detection_results", lambda: ResultChannel(maxlen=RESULT_BUFFER_SIZE))
+    preprocess = get_session_object(f"object_detection_preprocessor_{backend.name}", backend.preprocessor)
+    stream_frames = get_session_object("object_detection_frames", new_stream_frames)
+    keyframes = get_session_object("object_detection_keyframes", lambda: KeyframePolicy(MotionScore()))
+    tracker = get_session_object(f"object_detection_tracker_{backend.name}", Tracker)
+    governor = get_session_object("object_detection_governor", lambda: LatencyGovernor(target_ms=GOVERNOR_TARGET_MS, metrics=session_metrics))
+    roi = get_session_object("object_detection_roi", RegionOfInterest)
+    live_governors, live_regions = get_live_streams()
+    live_governors.add(governor)
+    live_regions.add(roi)
+    analytics = get_analytics_sink(tuple(backend.labels))
+    stream_id = get_session_object("object_detection_stream_id", lambda: uuid.uuid4().hex[:8])
+    motion_gate = get_session_object("object_detection_motion_gate", lambda: MotionGate(MotionScore()))
+    tiler = get_session_object(f"object_detection_tiler_{backend.name}", lambda: Tiler(backend.preprocessor(), backend.blob_shape, tile_size=max(backend.input_size)))
     
     html = """
     <div class="col2">
@@ -879,37 +1008,250 @@ with col2:
     
     st.markdown(html, unsafe_allow_html=True)
     score_threshold = st.slider(label="", label_visibility="collapsed", min_value=0, max_value=100, step=5, value=50)
-    result_queue: "queue.Queue[List[Detection]]" = queue.Queue()
+    with st.expander("Classes"):
+        class_settings = st.data_editor(
+            {"class": backend.labels[1:], "enabled": [True] * (len(backend.labels) - 1), "min_score": [None] * (len(backend.labels) - 1), "max_boxes": [None] * (len(backend.labels) - 1)},
+            key=f"object_detection_classes_{backend.name}", disabled=["class"], hide_index=True, use_container_width=True,
+            column_config={
+                "enabled": st.column_config.CheckboxColumn("Detect", help="Untick classes you do not need; they are dropped before any boxes are built."),
+                "min_score": st.column_config.NumberColumn("Threshold %", min_value=0, max_value=100, step=5, help="Overrides the probability threshold above for this class."),
+                "max_boxes": st.column_config.NumberColumn("Max boxes", min_value=0, step=1, help="Keeps only this many of the class's highest-scoring boxes per frame. Empty or 0 means no cap."),
+            },
+        )
+    if isinstance(backend.decoder, SSDDecoder):
+        # Frames of every stream share a forward and its decoding, so these are server settings (SSD_* variables)
+        decoder = backend.decoder
+        nms_label = {"class": "per class", "agnostic": "across classes", "soft": "soft"}[decoder.nms]
+        st.caption(f"Box decoding: {nms_label} NMS at IoU {decoder.nms_threshold:g}, candidates above {decoder.score_threshold:.0%}, top-k {decoder.top_k}, {decoder.keep_top_k} boxes per image.")
+    class_settings["min_score"] = [None if value is None or value != value else value / 100 for value in class_settings["min_score"]]
+    class_thresholds, class_caps = class_limits(len(backend.labels), score_threshold / 100, class_settings)
+    gate.redraw_skipped = st.checkbox("Keep showing the last detections on skipped frames", value=True)
+    detect_every = st.slider("Run the detector every N frames", min_value=1, max_value=10, value=1, help="Boxes are carried forward between detector runs; higher values save CPU at the cost of staler boxes.")
+    keyframes.motion_threshold = st.slider("Re-detect early when the scene changes by more than", min_value=0, max_value=50, value=0, help="Mean absolute difference of a small grayscale thumbnail against the last detector run. 0 turns the check off.")
+    governor.enabled = st.checkbox("Adapt quality to load", value=True, help="Lowers the frame size, detector cadence and frame rate of this stream while frames take longer than the target, and restores them when load drops.")
+    governor.target = st.slider("Target frame latency (ms)", min_value=10, max_value=500, step=10, value=int(GOVERNOR_TARGET_MS), disabled=not governor.enabled) / 1000
+    tiled = st.checkbox("Tiled high-resolution detection", help="Runs the detector on overlapping tiles of the full frame plus the whole frame, so small and distant objects keep their detail. Costs one forward per tile.")
+    # Two forwards leave room for a single tile, the whole frame again, so tiling starts at three
+    tiler.max_tiles = st.slider("Tile budget", min_value=3, max_value=16, value=min(max(TILE_BUDGET, 3), 16), help="Most forwards per frame, including the full-frame pass; a larger budget buys smaller tiles.", disabled=not tiled)
+    if tiled:
+        model_id = f"{model_id}/tiles-{tiler.max_tiles}"
+    show_track_ids = st.checkbox("Show track IDs")
+    with st.expander("Regions of interest"):
+        regions = st.text_area("Regions", placeholder="0.1,0.5 0.6,0.5 0.6,1 0.1,1", help="One polygon per line as x,y points, with x and y as fractions of the frame width and height. The detector only sees the rectangle around all regions, and only objects centred inside a region are kept. Leave empty to use the whole frame.")
+        try:
+            roi.polygons = parse_polygons(regions)
+        except ValueError as exc:
+            st.error(f"Regions ignored: {exc}")
+            roi.polygons = []
+        motion_gate.enabled = st.checkbox("Only run the detector when something moves", help="Skips detector runs while the regions, or the whole frame without regions, look the same as at the last run. Tracks are carried forward meanwhile.")
+        motion_gate.threshold = st.slider("Motion threshold", min_value=0.5, max_value=20.0, step=0.5, value=2.0, help="Mean absolute difference (0-255) of a small grayscale thumbnail that counts as movement.", disabled=not motion_gate.enabled)
+    if roi:
+        model_id = f"{model_id}/roi-{hash(regions)}"
+    show_performance = st.checkbox("Show performance panel")
    
     def video_frame_callback(frame: av.VideoFrame) -> av.VideoFrame:
-        image = frame.to_ndarray(format="bgr24")
-    
-        # Run inference
-        blob = cv2.dnn.blobFromImage(cv2.resize(image, (300, 300)), 0.007843, (300, 300), 127.5)
-        net.setInput(blob)
-        output = net.forward()
+        if not governor.admit():
+            # The governor has lowered this stream's frame rate; repeat the last annotated frame
+            session_metrics.increment("frames_strided")
+            return governor.last_output
+        timer = session_metrics.timer()
+        image = None
+        detect = False
+        in_flight = False
+        width, height = governor.frame_size(frame.width, frame.height)
+        if (width, height) != (frame.width, frame.height):
+            frame = frame.reformat(width=width, height=height)
+            timer.lap("scale")
+        tracker.resize(width, height)
+        keyframes.interval = detect_every * governor.interval
+        if gate.admit():
+            # Decode once into a frame slot; preprocessing, inference and drawing all use this view
+            slot, image = stream_frames.write(frame)
+            timer.lap("decode")
+            detect = keyframes.due(image)
+            if detect and motion_gate.enabled:
+                if not motion_gate.changed(image, roi.mask(*motion_gate.motion_score.size) if roi else None):
+                    # Nothing moved since the last detector run; keep the tracks in place instead
+                    detect = False
+                    tracker.hold()
+                    session_metrics.increment("frames_motion_skipped")
+                timer.lap("motion")
         
-        h, w = image.shape[:2]
-        # Convert the output array into a structured form.
-        output = output.squeeze()  # (1, 1, N, 7) -> (N, 7)
-        output = output[output[:, 2] >= score_threshold / 100]
-        detections = [Detection(class_id=int(detection[1]), label=CLASSES[int(detection[1])], score=float(detection[2]), box=(detection[3:7] * np.array([w, h, w, h])),) for detection in output]
+        if detect:
+            request = None
+            region = roi.bounds(width, height) if roi else None
+            if region is not None:
+                x0, y0, x1, y1 = region
+                crop = image[y0:y1, x0:x1]
+            else:
+                crop = image
+            # Shared-frame workers preprocess themselves and tiles are preprocessed per window; otherwise
+            # the blob is built first so the cache key hashes the 300x300 resized input instead of the full frame
+            blob = None
+            if not tiled and (region is not None or not (scheduler.accepts_frames and stream_frames.shared)):
+                blob = preprocess(crop)
+                timer.lap("preprocess")
+            cache_key = None
+            if RESULT_CACHE_SIZE:
+                # A frame identical to a recent one reuses its detections, or its request if still in flight.
+                # Without a blob only a thumbnail is hashed, and only when near-identical frames may match.
+                if blob is not None:
+                    cache_key = result_cache.key(model_id, preprocess.resized)
+                elif RESULT_CACHE_TOLERANCE:
+                    cache_key = result_cache.image_key(model_id, crop)
+                if cache_key is not None:
+                    request = result_cache.get(cache_key)
+                    timer.lap("cache")
+            if request is None:
+                # Run inference
+                if tiled:
+                    request = tiler.submit(scheduler, image, region)
+                    timer.lap("preprocess")
+                elif region is not None:
+                    # Only the rectangle around the regions goes through the detector
+                    request = TiledRequest([scheduler.submit(blob)], [region], width, height)
+                elif blob is None:
+                    request = scheduler.submit_frame(slot, image.shape)
+                else:
+                    request = scheduler.submit(blob)
+                if region is not None:
+                    session_metrics.increment("frames_roi_cropped")
+                if cache_key is not None:
+                    result_cache.put(cache_key, request)
+            stream_frames.hold(slot, request)
+            in_flight = gate.submit(request) is None
+            timer.lap("inference")
+        elif image is not None:
+            session_metrics.increment("frames_tracked")
+        else:
+            session_metrics.increment("frames_dropped")
+        
+        if gate.processed != tracker.generation:
+            # New detections arrived, for this frame or for an earlier one that was still in flight.
+            # Filter, scale and cast all boxes at once; Detection objects are only built by consumers.
+            detections = decode_detections(gate.detections, frame.width, frame.height, class_thresholds, class_caps)
+            if roi:
+                detections = detections[roi.contains(detections, frame.width, frame.height)]
+            boxes = tracker.update(detections, generation=gate.processed)
+            if analytics is not None:
+                analytics.record(stream_id, boxes, tracker=backend.name)
+        elif (image is not None and not detect) or gate.redraw_skipped:
+            # Between keyframes, or while inference is busy, carry the tracks forward
+            boxes = tracker.predict()
+        else:
+            boxes = None
+        timer.lap("postprocess")
+        
+        if boxes is None:
+            governor.observe(timer.stop(), scheduler.pending)
+            governor.last_output = frame
+            return frame
+        if image is None:
+            slot, image = stream_frames.write(frame)
+            timer.lap("decode")
+        elif in_flight:
+            # A worker may still be reading this slot
+            image = image.copy()
         
         # Render bounding boxes and captions
-        for detection in detections:
-            caption = f"{detection.label}: {round(detection.score * 100)}%"
-            color = COLORS[detection.class_id]
-            xmin, ymin, xmax, ymax = detection.box.astype("int")
-                        
-            cv2.rectangle(image, (xmin, ymin), (xmax, ymax), color, 4)
-            cv2.putText(image, caption, (xmin, ymin - 15 if ymin - 15 > 15 else ymin + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2,)
+        renderer.draw(image, boxes, show_track_ids=show_track_ids)
+        if roi:
+            roi.draw(image)
+        timer.lap("draw")
             
-        result_queue.put(detections)
+        result_channel.put(boxes)
         
-        return av.VideoFrame.from_ndarray(image, format="bgr24")
+        new_frame = av.VideoFrame.from_ndarray(image, format="bgr24")
+        timer.lap("encode")
+        governor.observe(timer.stop(), scheduler.pending)
+        governor.last_output = new_frame
+        return new_frame
     
+    if not scheduler.ready:
+        with st.spinner("Loading and warming up the detector..."):
+            scheduler.wait_ready(WARMUP_TIMEOUT_S)
+    if scheduler.warmup_error is not None:
+        st.warning(f"Detector warm-up failed: {scheduler.warmup_error}")
+    elif not scheduler.ready:
+        st.caption("Detector still warming up; the first frames may be slow.")
+    elif scheduler.warmup:
+        st.caption(f"Detector ready: first forward {scheduler.warmup['cold_forward_ms']:.0f} ms, warm {scheduler.warmup['warm_forward_ms']:.0f} ms.")
     webrtc_ctx = webrtc_streamer(key="object-detection", mode=WebRtcMode.SENDRECV, rtc_configuration={"iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]}, video_frame_callback=video_frame_callback, media_stream_constraints={"video": True, "audio": False}, async_processing=True,)
 
+    show_detections = st.checkbox("Show the detected objects")
+    show_stats = st.checkbox("Show stream statistics")
+
+    with st.expander("Detect objects in images"):
+        uploads = st.file_uploader("Images", type=list(IMAGE_EXTENSIONS), accept_multiple_files=True)
+        if uploads and st.button("Run detection"):
+            progress = st.progress(0.0, text="Detecting objects")
+            records = []
+            sources = ((upload.name, upload.getvalue()) for upload in uploads)
+            cache = result_cache if RESULT_CACHE_SIZE else None
+            for record, image in detect_images(sources, scheduler, backend.preprocessor, class_thresholds, backend.labels, renderer, cache=cache, model_id=model_id, max_per_class=class_caps):
+                records.append(record)
+                progress.progress(len(records) / len(uploads), text=f"Detected objects in {len(records)} of {len(uploads)} images")
+                if image is not None and len(records) <= BATCH_PREVIEW_IMAGES:
+                    st.image(image, channels="BGR", caption=f"{record['path']}: {len(record['detections'])} objects")
+            st.session_state["object_detection_batch_results"] = records
+        records = st.session_state.get("object_detection_batch_results")
+        if records:
+            for result_format, mime in (("jsonl", "application/jsonl"), ("csv", "text/csv")):
+                results = io.StringIO()
+                writer = ResultWriter(results, result_format)
+                for record in records:
+                    writer.write(record)
+                st.download_button(f"Download {result_format.upper()}", results.getvalue(), file_name=f"detections.{result_format}", mime=mime)
+    if analytics is not None:
+        with st.expander("Analytics"):
+            streams = analytics.streams()
+            scope = st.selectbox("Stream", ["All streams", *streams], format_func=lambda stream: f"{stream} (this stream)" if stream == stream_id else stream)
+            window_minutes = st.slider("Last minutes", min_value=5, max_value=24 * 60, step=5, value=60)
+            since = time.time() - window_minutes * 60
+            stream = None if scope == "All streams" else scope
+            counts = analytics.counts_over_time(since, stream)
+            if counts["time"]:
+                st.caption(f"Objects per frame, in {ANALYTICS_BUCKET_S:g} s buckets. The newest buckets appear after their flush.")
+                st.line_chart(counts, x="time", y="objects_per_frame", color="label")
+                st.table(analytics.class_histogram(since, stream))
+                st.caption("Dwell time of tracked objects")
+                st.table(analytics.dwell_times(since, stream))
+            else:
+                st.caption("No detections recorded in this window yet.")
+    if show_detections or show_stats or show_performance:
+        performance_placeholder = st.empty()
+        governor_placeholder = st.empty()
+        stats_placeholder = st.empty()
+        counts_placeholder = st.empty()
+        labels_placeholder = st.empty()
+        while webrtc_ctx.state.playing:
+            results = result_channel.drain(timeout=1)
+            if show_performance:
+                session_stages = session_metrics.snapshot()["stages"]
+                process_stages = process_metrics.snapshot()["stages"]
+                performance_placeholder.table(
+                    [{"stage": stage, "scope": "session", **summary} for stage, summary in session_stages.items()]
+                    + [{"stage": stage, "scope": "process", **summary} for stage, summary in process_stages.items()]
+                )
+                governor_placeholder.table([governor.stats()])
+            if show_stats:
+                region_stats = {name: session_metrics.counters.get(name, 0) for name in ("frames_motion_skipped", "frames_roi_cropped")}
+                region_stats["roi_area_fraction"] = round(roi.area_fraction(), 3)
+                analytics_stats = analytics.stats() if analytics is not None else {}
+                stats_placeholder.table([{**gate.stats(), **result_channel.stats(), **result_cache.stats(), **region_stats, **analytics_stats}])
+            if show_detections and results:
+                detections: List[Detection] = to_detections(results[-1], backend.labels)
+                counts = Counter(detection.label for detection in detections)
+                counts_placeholder.table([{"label": label, "count": count} for label, count in counts.most_common()])
+                labels_placeholder.table([{"track": detection.track_id, "label": detection.label, "score": f"{detection.score:.2f}", "box": detection.box.astype(int).tolist()} for detection in detections])
+            time.sleep(0.5)
+
+
+if ANALYTICS_DB:
+    # Analytics keep per-class counts and track sightings of each stream, never the frames themselves
+    disclaimer = "No images are recorded or stored, but detection counts per stream are kept for analytics."
+else:
+    disclaimer = "No images or data are recorded or stored."
 
 footer = """
 <style>
@@ -993,7 +1335,7 @@ footer = """
             <b><span style="color: #FAFAFA;">Contents &copy; oxbr</span><span style="color: #FCBC24;">AI</span><span style="color: #FAFAFA;">n 2023</span></b>
         </div>
         <div class="middle-column-footer">
-            <b>DISCLAIMER: No images or data are recorded or stored. This playground is intended for educational purposes only.</b>
+            <b>DISCLAIMER: """ + disclaimer + """ This playground is intended for educational purposes only.</b>
         </div>
         <div class="clear"></div>
     </div>
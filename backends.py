@@ -0,0 +1,219 @@
+import copy
+import glob
+import os
+
+import cv2
+import numpy as np
+
+from detector import split_detections
+from pipeline import CLASSES, Preprocessor
+from ssd import SSD_OUTPUTS, SSDDecoder
+
+# Converted model artefacts, e.g. half-precision weights, are written here once and reused.
+MODEL_CACHE_DIR = os.environ.get("MODEL_CACHE_DIR", "model/cache")
+# Images used to calibrate INT8 activation ranges; random frames are used when unset.
+CALIBRATION_DIR = os.environ.get("CALIBRATION_DIR")
+
+# NumPy SSD decoder of caffe-ssd-numpy: one setting for the whole server, since frames of every stream share a forward
+SSD_NMS = os.environ.get("SSD_NMS", "class")
+SSD_NMS_THRESHOLD = float(os.environ.get("SSD_NMS_THRESHOLD", 0.45))
+SSD_SCORE_THRESHOLD = float(os.environ.get("SSD_SCORE_THRESHOLD", 0.25))
+SSD_TOP_K = int(os.environ.get("SSD_TOP_K", 100))
+SSD_KEEP_TOP_K = int(os.environ.get("SSD_KEEP_TOP_K", 100))
+
+# OpenCV DNN backends and targets that compute on the CPU
+CPU_BACKENDS = {
+    "OpenCV": cv2.dnn.DNN_BACKEND_OPENCV,
+    "OpenVINO": cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE,
+}
+CPU_TARGETS = {
+    "CPU": cv2.dnn.DNN_TARGET_CPU,
+    "CPU FP16": cv2.dnn.DNN_TARGET_CPU_FP16,
+}
+
+
+class DetectorBackend:
+    # One detection network: how to load it, what input it expects and how to read its output.
+    # Decoders turn a batched forward() output into per-image (image_id, class_id, score, x0, y0, x1, y1)
+    # rows with normalised corners, the format every later stage consumes.
+    # precision "int8" quantizes the loaded net, calibrated on `calibration` images.
+    # Hidden backends, such as test stand-ins, can be requested by name but are not offered on the page.
+    def __init__(self, name, title, loader, files, decoder=split_detections, labels=CLASSES, input_size=(300, 300), scale=0.007843, mean=127.5, swap_rb=False, output_names=None, precision="fp32", calibration=CALIBRATION_DIR, dnn_backend=cv2.dnn.DNN_BACKEND_DEFAULT, dnn_target=cv2.dnn.DNN_TARGET_CPU, hidden=False):
+        self.name = name
+        self.title = title
+        self.loader = loader
+        self.files = tuple(files)
+        self.decoder = decoder
+        self.labels = labels
+        self.input_size = input_size
+        self.scale = scale
+        self.mean = mean
+        self.swap_rb = swap_rb
+        self.output_names = output_names
+        self.precision = precision
+        self.calibration = calibration
+        self.dnn_backend = dnn_backend
+        self.dnn_target = dnn_target
+        self.hidden = hidden
+
+    @property
+    def available(self):
+        return all(os.path.exists(path) for path in self.files)
+
+    @property
+    def blob_shape(self):
+        width, height = self.input_size
+        return (3, height, width)
+
+    def load(self):
+        net = self.loader(*self.files)
+        if self.precision == "int8":
+            net = net.quantize([self.calibration_batch()], cv2.CV_32F, cv2.CV_32F)
+        net.setPreferableBackend(self.dnn_backend)
+        net.setPreferableTarget(self.dnn_target)
+        return net
+
+    def on(self, dnn_backend, dnn_target):
+        backend = copy.copy(self)
+        backend.dnn_backend = dnn_backend
+        backend.dnn_target = dnn_target
+        return backend
+
+    def calibration_batch(self, count=16):
+        preprocess = self.preprocessor()
+        paths = sorted(glob.glob(os.path.join(self.calibration, "*"))) if self.calibration else []
+        images = [image for image in map(cv2.imread, paths) if image is not None][:count]
+        if not images:
+            rng = np.random.default_rng(0)
+            images = list(rng.integers(0, 256, (count, 480, 640, 3), dtype=np.uint8))
+        return np.concatenate([preprocess(image) for image in images])
+
+    def preprocessor(self):
+        return Preprocessor(size=self.input_size, scale=self.scale, mean=self.mean, swap_rb=self.swap_rb)
+
+    def forward(self, net, blob):
+        net.setInput(blob)
+        if self.output_names:
+            return net.forward(list(self.output_names))
+        return net.forward()
+
+    def decode(self, output, num_images):
+        return self.decoder(output, num_images)
+
+
+def split_boxes_scores(output, num_images, score_threshold=0.01, nms_threshold=0.45, top_k=200):
+    # For nets that stop before NMS: (N, P, C) class scores with background at 0 and (N, P, 4) normalised corners.
+    scores, boxes = output
+    scores = scores.reshape(num_images, -1, scores.shape[-1])
+    boxes = boxes.reshape(num_images, -1, 4)
+    parts = []
+    for image_id in range(num_images):
+        priors, classes = np.nonzero(scores[image_id, :, 1:] > score_threshold)
+        confidences = scores[image_id, priors, classes + 1]
+        corners = boxes[image_id, priors]
+        rects = np.concatenate([corners[:, :2], corners[:, 2:] - corners[:, :2]], axis=1)
+        keep = np.asarray(cv2.dnn.NMSBoxesBatched(rects.tolist(), confidences.tolist(), classes.tolist(), score_threshold, nms_threshold, top_k=top_k), dtype=np.intp).reshape(-1)
+        rows = np.empty((len(keep), 7), dtype=np.float32)
+        rows[:, 0] = image_id
+        rows[:, 1] = classes[keep] + 1
+        rows[:, 2] = confidences[keep]
+        rows[:, 3:] = corners[keep]
+        parts.append(rows)
+    return parts
+
+
+class DummyNet:
+    # Stands in for a cv2.dnn.Net without any model files: one centred "person" per image.
+    def setInput(self, blob):
+        self.blob = blob
+
+    def forward(self, *output_names):
+        rows = np.zeros((1, 1, len(self.blob), 7), dtype=np.float32)
+        rows[0, 0, :, 0] = np.arange(len(self.blob))
+        rows[0, 0, :, 1:] = (CLASSES.index("person"), 0.9, 0.25, 0.25, 0.75, 0.75)
+        return rows
+
+    def setPreferableBackend(self, backend):
+        pass
+
+    def setPreferableTarget(self, target):
+        pass
+
+
+def compute_options():
+    # {label: (backend, target)} for every CPU combination this OpenCV build can run.
+    options = {}
+    for backend_label, backend in CPU_BACKENDS.items():
+        available = set(np.asarray(cv2.dnn.getAvailableTargets(backend)).reshape(-1).tolist())
+        for target_label, target in CPU_TARGETS.items():
+            if target in available:
+                options[f"{backend_label} / {target_label}"] = (backend, target)
+    return options
+
+
+def fp16_caffemodel(model, cache_dir=MODEL_CACHE_DIR):
+    # One-time conversion of the weights to half precision, redone when the source model is newer.
+    stem = os.path.splitext(os.path.basename(model))[0]
+    path = os.path.join(cache_dir, f"{stem}.fp16.caffemodel")
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(model):
+        os.makedirs(cache_dir, exist_ok=True)
+        partial = f"{path}.{os.getpid()}.partial"
+        cv2.dnn.shrinkCaffeModel(model, partial)
+        os.replace(partial, path)
+    return path
+
+
+def load_caffe_fp16(prototxt, model):
+    return cv2.dnn.readNetFromCaffe(prototxt, fp16_caffemodel(model))
+
+
+def load_tflite(model):
+    # readNetFromTFLite needs OpenCV 4.8 or later.
+    return cv2.dnn.readNetFromTFLite(model)
+
+
+def caffe_ssd(prototxt, model, name="caffe-ssd", title="MobileNet-SSD (Caffe)", precision="fp32", decoder=None):
+    # fp16 stores the weights in half precision; they are expanded again at load unless the target computes in FP16.
+    # With an SSDDecoder the graph is cut before DetectionOutput and boxes are decoded in NumPy.
+    loader = load_caffe_fp16 if precision == "fp16" else cv2.dnn.readNetFromCaffe
+    if decoder is not None:
+        return DetectorBackend(name, title, loader, (prototxt, model), decoder=decoder, precision=precision, output_names=SSD_OUTPUTS)
+    return DetectorBackend(name, title, loader, (prototxt, model), precision=precision)
+
+
+def onnx_ssd(model, name="onnx-ssd", title="MobileNet-SSD (ONNX)"):
+    # pytorch-ssd style export: RGB input normalised with (x - 127) / 128, "scores" and "boxes" outputs.
+    return DetectorBackend(name, title, cv2.dnn.readNetFromONNX, (model,), decoder=split_boxes_scores, scale=1 / 128, mean=127, swap_rb=True, output_names=("scores", "boxes"))
+
+
+def tflite_ssd(model, name="tflite-ssd", title="MobileNet-SSD quantized (TFLite)"):
+    # Quantized export of the same network; the int8 weights are dequantized by the importer.
+    return DetectorBackend(name, title, load_tflite, (model,), decoder=split_boxes_scores, scale=1 / 127.5, mean=127.5, swap_rb=True, output_names=("scores", "boxes"))
+
+
+BACKENDS = {}
+
+
+def register_backend(backend):
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+def get_backend(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown detector backend {name!r}, expected one of {', '.join(BACKENDS)}") from None
+
+
+def available_backends():
+    return [backend for backend in BACKENDS.values() if backend.available and not backend.hidden]
+
+
+register_backend(caffe_ssd("model/MobileNetSSD_deploy.prototxt.txt", "model/MobileNetSSD_deploy.caffemodel"))
+register_backend(caffe_ssd("model/MobileNetSSD_deploy.prototxt.txt", "model/MobileNetSSD_deploy.caffemodel", name="caffe-ssd-fp16", title="MobileNet-SSD (Caffe, FP16 weights)", precision="fp16"))
+register_backend(caffe_ssd("model/MobileNetSSD_deploy.prototxt.txt", "model/MobileNetSSD_deploy.caffemodel", name="caffe-ssd-int8", title="MobileNet-SSD (Caffe, INT8)", precision="int8"))
+register_backend(caffe_ssd("model/MobileNetSSD_deploy.prototxt.txt", "model/MobileNetSSD_deploy.caffemodel", name="caffe-ssd-numpy", title="MobileNet-SSD (Caffe, NumPy decoder)", decoder=SSDDecoder(SSD_SCORE_THRESHOLD, SSD_NMS_THRESHOLD, SSD_TOP_K, SSD_KEEP_TOP_K, nms=SSD_NMS)))
+register_backend(onnx_ssd("model/MobileNetSSD.onnx"))
+register_backend(tflite_ssd("model/MobileNetSSD_quant.tflite"))
+register_backend(DetectorBackend("dummy", "Dummy (no model, for tests)", DummyNet, (), hidden=True))
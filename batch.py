@@ -0,0 +1,168 @@
+import argparse
+import collections
+import concurrent.futures
+import csv
+import json
+import os
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+from backends import BACKENDS, compute_options, get_backend
+from detector import DetectorPool, InferenceScheduler
+from pipeline import CLASSES, DetectionRenderer, decode_detections, label_colors, to_detections
+
+IMAGE_EXTENSIONS = ("jpg", "jpeg", "png", "bmp", "webp", "tif", "tiff")
+CSV_FIELDS = ("path", "width", "height", "label", "class_id", "score", "x0", "y0", "x1", "y1", "error")
+
+
+def iter_image_paths(directory, recursive=True):
+    # Sorted per directory so runs are reproducible; paths are yielded lazily.
+    with os.scandir(directory) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir():
+            if recursive:
+                yield from iter_image_paths(entry.path, recursive)
+        elif entry.name.rsplit(".", 1)[-1].lower() in IMAGE_EXTENSIONS:
+            yield entry.path
+
+
+def load_image(data):
+    # data is a file path or the encoded bytes of an upload.
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imread(data)
+
+
+def detect_images(sources, scheduler, preprocessor, threshold=0.5, labels=CLASSES, renderer=None, annotated_dir=None, workers=4, prefetch=16, cache=None, model_id=None, max_per_class=None):
+    # sources yields (name, path or bytes). Yields (record, annotated image or None) in source order; with
+    # annotated_dir the annotated images are written there under their name instead of being returned.
+    # With a DetectionCache, repeated images reuse the detections stored under model_id.
+    # threshold and max_per_class are passed on to decode_detections, so they can also be per-class arrays.
+    # Reading, preprocessing and writing run on `workers` threads; at most `prefetch` images are loaded or in flight.
+    local = threading.local()
+
+    def run(name, data):
+        image = load_image(data)
+        if image is None:
+            return {"path": name, "error": "unreadable image"}, None
+        if not hasattr(local, "preprocess"):
+            local.preprocess = preprocessor()
+        height, width = image.shape[:2]
+        blob = local.preprocess(image)
+        if cache is None:
+            output = scheduler.infer(blob)
+        else:
+            request = cache.submit(cache.key(model_id, blob), lambda: scheduler.submit(blob))
+            request.done.wait()
+            if request.error is not None:
+                raise request.error
+            output = request.output
+        boxes = decode_detections(output, width, height, threshold, max_per_class)
+        record = {
+            "path": name,
+            "width": width,
+            "height": height,
+            "detections": [
+                {"label": detection.label, "class_id": detection.class_id, "score": round(detection.score, 4), "box": detection.box.tolist()}
+                for detection in to_detections(boxes, labels)
+            ],
+        }
+        if renderer is None:
+            return record, None
+        renderer.draw(image, boxes)
+        if annotated_dir is None:
+            return record, image
+        record["annotated"] = os.path.join(annotated_dir, name)
+        os.makedirs(os.path.dirname(record["annotated"]), exist_ok=True)
+        cv2.imwrite(record["annotated"], image)
+        return record, None
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-detect")
+    pending = collections.deque()
+    try:
+        for name, data in sources:
+            pending.append(executor.submit(run, name, data))
+            if len(pending) >= prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+class ResultWriter:
+    # Writes one record at a time as a JSON line or as one CSV row per detection.
+    def __init__(self, stream, format="jsonl"):
+        if format not in ("jsonl", "csv"):
+            raise ValueError(f"Unknown result format {format!r}, expected 'jsonl' or 'csv'")
+        self.stream = stream
+        self.format = format
+        self._csv = None
+        if format == "csv":
+            self._csv = csv.DictWriter(stream, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            self._csv.writeheader()
+
+    def write(self, record):
+        if self._csv is None:
+            self.stream.write(json.dumps(record) + "\n")
+        elif record.get("error") or not record["detections"]:
+            self._csv.writerow(record)
+        else:
+            for detection in record["detections"]:
+                x0, y0, x1, y1 = detection["box"]
+                self._csv.writerow({**record, **detection, "x0": x0, "y0": y0, "x1": x1, "y1": y1})
+        self.stream.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the object detector over a directory of images.")
+    parser.add_argument("input", help="directory of images, searched recursively")
+    parser.add_argument("--output", help="results file; defaults to stdout")
+    parser.add_argument("--format", choices=("jsonl", "csv"), default="jsonl")
+    parser.add_argument("--annotated-dir", help="also write images with the detections drawn on them here")
+    parser.add_argument("--detector", choices=tuple(BACKENDS), default="caffe-ssd", help="registered detector backend")
+    parser.add_argument("--compute", choices=tuple(compute_options()), default="OpenCV / CPU", help="OpenCV DNN backend / target")
+    parser.add_argument("--threshold", type=float, default=0.5, help="minimum detection score")
+    parser.add_argument("--backend", choices=("thread", "process"), default="thread", help="run forward passes on a thread pool or in worker processes")
+    parser.add_argument("--pool-size", type=int, default=2, help="nets in the thread backend pool")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes for the process backend")
+    parser.add_argument("--readers", type=int, default=4, help="threads reading and preprocessing images")
+    parser.add_argument("--prefetch", type=int, default=16, help="images loaded or in flight at once")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    args = parser.parse_args(argv)
+
+    detector = get_backend(args.detector).on(*compute_options()[args.compute])
+    if args.backend == "process":
+        from process_scheduler import ProcessScheduler
+
+        scheduler = ProcessScheduler(detector, workers=args.workers, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    else:
+        scheduler = InferenceScheduler(DetectorPool(detector, size=args.pool_size), max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    renderer = DetectionRenderer(label_colors(len(detector.labels)), detector.labels) if args.annotated_dir else None
+    sources = ((os.path.relpath(path, args.input), path) for path in iter_image_paths(args.input))
+    stream = open(args.output, "w", newline="") if args.output else sys.stdout
+    writer = ResultWriter(stream, args.format)
+    processed = failed = 0
+    try:
+        # Nets load and warm up before the first image is read
+        scheduler.wait_ready()
+        for record, _ in detect_images(sources, scheduler, detector.preprocessor, args.threshold, detector.labels, renderer, args.annotated_dir, args.readers, args.prefetch):
+            writer.write(record)
+            processed += 1
+            failed += "error" in record
+    finally:
+        scheduler.close()
+        if stream is not sys.stdout:
+            stream.close()
+    print(f"{processed} images, {failed} unreadable", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,650 @@
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import av
+import cv2
+import numpy as np
+
+from backends import BACKENDS, caffe_ssd, compute_options, fp16_caffemodel, get_backend
+from boxes import corners, iou_matrix
+from detector import DetectorPool, InferenceScheduler, split_detections
+from frame_ring import FrameRing
+from pipeline import DetectionRenderer, Preprocessor, decode_detections, label_colors
+from process_scheduler import ProcessScheduler
+from ssd import NMS_MODES, SSD_OUTPUTS, SSDDecoder
+from tiling import Tiler
+from tracking import greedy_match
+
+MODEL = "model/MobileNetSSD_deploy.caffemodel"
+PROTOTXT = "model/MobileNetSSD_deploy.prototxt.txt"
+STAGES = ("decode", "preprocess", "forward", "postprocess", "draw", "encode")
+# Modules the page imports itself, timed after streamlit and streamlit_webrtc are loaded
+APP_MODULES = ("analytics", "backends", "batch", "detector", "frame_ring", "metrics", "motion", "pipeline", "result_cache", "roi", "ssd", "streaming", "tiling", "tracking")
+# Runs in a fresh interpreter. webrtc_streamer is replaced by a stub that reports a stopped stream,
+# so the whole page script renders headless.
+STARTUP_PROBE = '''
+import json, os, sys, time
+start = time.perf_counter()
+import streamlit, streamlit_webrtc
+framework = time.perf_counter()
+for module in sys.argv[1].split(","):
+    __import__(module)
+modules = time.perf_counter()
+# Checked before AppTest, which imports matplotlib for st.pyplot itself
+matplotlib_loaded = "matplotlib" in sys.modules
+# Only the process inference backend needs these
+process_scheduler_loaded = "process_scheduler" in sys.modules
+shared_memory_loaded = "multiprocessing.shared_memory" in sys.modules
+
+class State:
+    playing = False
+    signalling = False
+
+class Context:
+    state = State()
+
+streamlit_webrtc.webrtc_streamer = lambda **kwargs: Context()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("app.py", default_timeout=120)
+# The page normally waits for the detector warm-up before offering the camera; render without waiting first
+os.environ["WARMUP_TIMEOUT_S"] = "0"
+render = time.perf_counter()
+app.run()
+rendered = time.perf_counter()
+app.run()
+rerendered = time.perf_counter()
+os.environ["WARMUP_TIMEOUT_S"] = "120"
+app.run()
+ready = time.perf_counter()
+print(json.dumps({
+    "framework_import_ms": (framework - start) * 1000,
+    "app_import_ms": (modules - framework) * 1000,
+    "first_render_ms": (rendered - render) * 1000,
+    "rerun_ms": (rerendered - rendered) * 1000,
+    "ready_ms": (ready - render) * 1000,
+    "exceptions": [exception.message for exception in app.exception],
+    "matplotlib_loaded": matplotlib_loaded,
+    "process_scheduler_loaded": process_scheduler_loaded,
+    "shared_memory_loaded": shared_memory_loaded,
+}))
+'''
+
+
+def parse_resolution(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def summarize(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        "mean_ms": round(float(samples.mean()), 4),
+        "p50_ms": round(float(np.percentile(samples, 50)), 4),
+        "p95_ms": round(float(np.percentile(samples, 95)), 4),
+        "p99_ms": round(float(np.percentile(samples, 99)), 4),
+    }
+
+
+def synthetic_frames(resolution, count, seed=0):
+    width, height = resolution
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def load_frames(directory, resolution, count):
+    frames = []
+    for name in sorted(os.listdir(directory)):
+        image = cv2.imread(os.path.join(directory, name))
+        if image is not None:
+            frames.append(cv2.resize(image, resolution))
+        if len(frames) == count:
+            break
+    if not frames:
+        raise SystemExit(f"No readable images found in {directory}")
+    return frames
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux.
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if not value:
+            out.append(byte)
+            return bytes(out)
+        out.append(byte | 0x80)
+
+
+def _message(field, payload):
+    return _varint(field << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _blob(array):
+    # caffe.BlobProto: shape (7) holding BlobShape.dim (1), data (5) as packed floats.
+    dims = b"".join(_varint(dim) for dim in array.shape)
+    return _message(7, _message(1, dims)) + _message(5, array.astype("<f4").tobytes())
+
+
+def write_random_caffemodel(prototxt, path, seed=0):
+    # Serializes a caffe.NetParameter with He-initialised weights for every Convolution layer.
+    # A few confidence channels get a large bias so the net emits boxes and drawing is exercised.
+    rng = np.random.default_rng(seed)
+    with open(prototxt) as f:
+        text = f.read()
+    channels = {"data": 3}
+    layers = []
+    for block in re.split(r"\nlayer \{", text)[1:]:
+        name = re.search(r'name: "([^"]+)"', block).group(1)
+        kind = re.search(r'type: "([^"]+)"', block).group(1)
+        bottoms = re.findall(r'bottom: "([^"]+)"', block)
+        tops = re.findall(r'top: "([^"]+)"', block)
+        if kind == "Convolution":
+            num_output = int(re.search(r"num_output: (\d+)", block).group(1))
+            kernel = int(re.search(r"kernel_size: (\d+)", block).group(1))
+            group = re.search(r"group: (\d+)", block)
+            in_channels = channels[bottoms[0]] // (int(group.group(1)) if group else 1)
+            weights = rng.normal(0, np.sqrt(2 / (in_channels * kernel * kernel)), (num_output, in_channels, kernel, kernel))
+            bias = np.zeros(num_output)
+            if name.endswith("mbox_conf"):
+                bias[rng.random(num_output) < 0.02] = 6.0
+            layer = _message(1, name.encode()) + _message(2, kind.encode()) + _message(7, _blob(weights)) + _message(7, _blob(bias))
+            layers.append(_message(100, layer))
+            channels[tops[0]] = num_output
+        elif bottoms and tops:
+            channels.setdefault(tops[0], channels.get(bottoms[0], 0))
+    with open(path, "wb") as f:
+        f.write(b"".join(layers))
+
+
+def resolve_model(args):
+    if args.model and os.path.exists(args.model) and not args.random_weights:
+        return args.model, False
+    path = os.path.join(tempfile.gettempdir(), "MobileNetSSD_random.caffemodel")
+    if not os.path.exists(path):
+        write_random_caffemodel(args.prototxt, path)
+    return path, True
+
+
+def time_per_frame(run, frames, repeat):
+    timings = []
+    for _ in range(repeat):
+        for frame in frames:
+            start = time.perf_counter()
+            run(frame)
+            timings.append(time.perf_counter() - start)
+    # Transient allocations per frame: numpy (and cv2 output arrays) are traced by tracemalloc.
+    peaks = []
+    tracemalloc.start()
+    for frame in frames:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run(frame)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return {**summarize(timings), "allocated_bytes_per_frame": int(np.mean(peaks))}
+
+
+def bench_preprocess(args):
+    frames = synthetic_frames(args.resolution, args.frames)
+    # A scalar mean is read by OpenCV as (127.5, 0, 0), so spell out all three channels for the comparison.
+    baseline = lambda image: cv2.dnn.blobFromImage(cv2.resize(image, (300, 300)), 0.007843, (300, 300), (127.5, 127.5, 127.5))
+    preprocessor = Preprocessor()
+    reference = baseline(frames[0])
+    return {
+        "resolution": "x".join(map(str, args.resolution)),
+        "frames": args.frames * args.repeat,
+        "max_abs_difference": float(np.abs(preprocessor(frames[0]) - reference).max()),
+        "blob_from_image": time_per_frame(baseline, frames, args.repeat),
+        "preallocated": time_per_frame(preprocessor, frames, args.repeat),
+    }
+
+
+def bench_transport(args):
+    # WebRTC delivers yuv420p frames; compare to_ndarray/from_ndarray copies with decoding into a frame slot.
+    renderer = DetectionRenderer(label_colors())
+    preprocess = Preprocessor()
+    results = []
+    for resolution in args.resolutions:
+        width, height = resolution
+        frames = [av.VideoFrame.from_ndarray(image, format="bgr24").reformat(format="yuv420p") for image in synthetic_frames(resolution, 5)]
+        rows = np.tile(np.array([[0, 15, 0.9, 0.1, 0.1, 0.4, 0.6]], dtype=np.float32), (10, 1))
+        boxes = decode_detections(rows, width, height, 0.5)
+        stream_frames = FrameRing(3, width * height * 3, shared=args.shared).stream()
+
+        def copy_path(frame):
+            image = frame.to_ndarray(format="bgr24")
+            preprocess(image)
+            renderer.draw(image, boxes)
+            return av.VideoFrame.from_ndarray(image, format="bgr24")
+
+        def slot_path(frame):
+            _, image = stream_frames.write(frame)
+            preprocess(image)
+            renderer.draw(image, boxes)
+            return av.VideoFrame.from_ndarray(image, format="bgr24")
+
+        results.append({
+            "resolution": f"{width}x{height}",
+            "to_ndarray": time_per_frame(copy_path, frames, args.repeat),
+            "frame_slot": time_per_frame(slot_path, frames, args.repeat),
+        })
+        stream_frames.ring.close()
+    return {"shared_memory": args.shared, "runs": results}
+
+
+def run_stream(frames, count, warmup, scheduler, renderer, threshold, timings, backend):
+    # Mirrors video_frame_callback: decode, preprocess, forward, threshold, draw and re-encode.
+    preprocess = backend.preprocessor()
+    video_frames = [av.VideoFrame.from_ndarray(frame, format="bgr24") for frame in frames]
+    for i in range(warmup + count):
+        frame = video_frames[i % len(video_frames)]
+        marks = [time.perf_counter()]
+        image = frame.to_ndarray(format="bgr24")
+        marks.append(time.perf_counter())
+        blob = preprocess(image)
+        marks.append(time.perf_counter())
+        output = scheduler.infer(blob)
+        marks.append(time.perf_counter())
+        h, w = image.shape[:2]
+        boxes = decode_detections(output, w, h, threshold)
+        marks.append(time.perf_counter())
+        renderer.draw(image, boxes)
+        marks.append(time.perf_counter())
+        av.VideoFrame.from_ndarray(image, format="bgr24")
+        marks.append(time.perf_counter())
+        if i >= warmup:
+            for stage, start, end in zip(STAGES, marks, marks[1:]):
+                timings[stage].append(end - start)
+            timings["total"].append(marks[-1] - marks[0])
+
+
+def bench_pipeline(args):
+    if args.detector == "caffe-ssd":
+        model, random_weights = resolve_model(args)
+        detector = caffe_ssd(args.prototxt, model)
+    else:
+        detector = get_backend(args.detector)
+        model, random_weights = ", ".join(detector.files), False
+    if args.backend == "process":
+        scheduler = ProcessScheduler(detector, workers=args.workers, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    else:
+        pool = DetectorPool(detector, size=args.pool_size)
+        scheduler = InferenceScheduler(pool, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    # Keep model loading and first-forward setup out of the timed runs
+    scheduler.wait_ready()
+    renderer = DetectionRenderer(label_colors(len(detector.labels)), detector.labels)
+    runs = []
+    for resolution in args.resolutions:
+        if args.frames_dir:
+            frames = load_frames(args.frames_dir, resolution, args.distinct_frames)
+        else:
+            frames = synthetic_frames(resolution, args.distinct_frames)
+        for streams in args.streams:
+            timings = [{stage: [] for stage in (*STAGES, "total")} for _ in range(streams)]
+            threads = [
+                threading.Thread(target=run_stream, args=(frames, args.frames, args.warmup, scheduler, renderer, args.threshold, timings[i], detector))
+                for i in range(streams)
+            ]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            merged = {stage: [t for stream in timings for t in stream[stage]] for stage in timings[0]}
+            runs.append({
+                "resolution": "x".join(map(str, resolution)),
+                "streams": streams,
+                "frames": len(merged["total"]),
+                "fps": round(len(merged["total"]) / elapsed, 2),
+                "fps_per_stream": round(len(merged["total"]) / elapsed / streams, 2),
+                "stages": {stage: summarize(samples) for stage, samples in merged.items()},
+                "peak_rss_mb": peak_rss_mb(),
+            })
+    scheduler.close()
+    return {
+        "detector": detector.name,
+        "model": model,
+        "random_weights": random_weights,
+        "cpu_count": os.cpu_count(),
+        "backend": args.backend,
+        "pool_size": args.pool_size,
+        "workers": args.workers,
+        "max_batch": args.max_batch,
+        "max_wait_ms": args.max_wait_ms,
+        "warmup": scheduler.warmup,
+        "runs": runs,
+    }
+
+
+def compare_detections(reference, candidate, iou_threshold):
+    # Same-class greedy IoU matching of one frame's detections against the FP32 reference.
+    iou = iou_matrix(corners(reference), corners(candidate))
+    iou[reference["class_id"][:, None] != candidate["class_id"][None, :]] = 0
+    rows, columns = greedy_match(iou, iou_threshold)
+    return iou[rows, columns], np.abs(reference["score"][rows] - candidate["score"][columns])
+
+
+def bench_precision(args):
+    model, random_weights = resolve_model(args)
+    if args.frames_dir:
+        frames = load_frames(args.frames_dir, args.resolution, args.frames)
+    else:
+        frames = synthetic_frames(args.resolution, args.frames)
+    dnn_backend, dnn_target = compute_options()[args.compute]
+    width, height = args.resolution
+    modes, detections = {}, {}
+    for precision in ("fp32", *args.modes):
+        detector = caffe_ssd(args.prototxt, model, precision=precision)
+        detector.calibration = args.calibration_dir or args.frames_dir
+        detector = detector.on(dnn_backend, dnn_target)
+        start = time.perf_counter()
+        net = detector.load()
+        load_s = time.perf_counter() - start
+        preprocess = detector.preprocessor()
+        latencies = []
+        detections[precision] = []
+        for i in range(args.warmup + len(frames) * args.repeat):
+            frame = frames[i % len(frames)]
+            start = time.perf_counter()
+            output = detector.forward(net, preprocess(frame))
+            if i >= args.warmup:
+                latencies.append(time.perf_counter() - start)
+            if i >= args.warmup and len(detections[precision]) < len(frames):
+                detections[precision].append(decode_detections(detector.decode(output, 1)[0], width, height, args.threshold))
+        weights = fp16_caffemodel(model) if precision == "fp16" else model
+        modes[precision] = {"load_s": round(load_s, 3), "weights_mb": round(os.path.getsize(weights) / 2**20, 2), "latency": summarize(latencies)}
+
+    for precision, mode in modes.items():
+        mode["speedup"] = round(modes["fp32"]["latency"]["p50_ms"] / mode["latency"]["p50_ms"], 3)
+        ious, score_deltas = [], []
+        for expected, actual in zip(detections["fp32"], detections[precision]):
+            iou, score_delta = compare_detections(expected, actual, args.iou_threshold)
+            ious.extend(iou.tolist())
+            score_deltas.extend(score_delta.tolist())
+        expected_count = sum(len(boxes) for boxes in detections["fp32"])
+        actual_count = sum(len(boxes) for boxes in detections[precision])
+        mode["agreement"] = {
+            "reference_detections": expected_count,
+            "detections": actual_count,
+            "matched": len(ious),
+            "recall": round(len(ious) / expected_count, 4) if expected_count else 1.0,
+            "precision": round(len(ious) / actual_count, 4) if actual_count else 1.0,
+            "mean_iou": round(float(np.mean(ious)), 4) if ious else None,
+            "mean_score_delta": round(float(np.mean(score_deltas)), 4) if ious else None,
+            "max_score_delta": round(float(np.max(score_deltas)), 4) if ious else None,
+        }
+    return {
+        "model": model,
+        "random_weights": random_weights,
+        "compute": args.compute,
+        "resolution": "x".join(map(str, args.resolution)),
+        "frames": len(frames) * args.repeat,
+        "threshold": args.threshold,
+        "modes": modes,
+    }
+
+
+def bench_tiling(args):
+    model, random_weights = resolve_model(args)
+    detector = caffe_ssd(args.prototxt, model).on(*compute_options()[args.compute])
+    scheduler = InferenceScheduler(DetectorPool(detector, size=args.pool_size), max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    scheduler.wait_ready()
+    preprocess = detector.preprocessor()
+    runs = []
+    for resolution in args.resolutions:
+        width, height = resolution
+        if args.frames_dir:
+            frames = load_frames(args.frames_dir, resolution, args.frames)
+        else:
+            frames = synthetic_frames(resolution, args.frames)
+        # A budget of 1 is the full-frame path: one resized forward per frame
+        for budget in (1, *args.budgets):
+            tiler = Tiler(preprocess, detector.blob_shape, tile_size=max(detector.input_size), overlap=args.overlap, max_tiles=budget, iou_threshold=args.nms_threshold)
+            latencies, counts = [], []
+            for i in range(args.warmup + len(frames) * args.repeat):
+                frame = frames[i % len(frames)]
+                start = time.perf_counter()
+                if budget == 1:
+                    rows = scheduler.infer(preprocess(frame))
+                else:
+                    request = tiler.submit(scheduler, frame)
+                    request.done.wait()
+                    if request.error is not None:
+                        raise request.error
+                    rows = request.output
+                boxes = decode_detections(rows, width, height, args.threshold)
+                if i >= args.warmup:
+                    latencies.append(time.perf_counter() - start)
+                    counts.append(len(boxes))
+            runs.append({
+                "resolution": "x".join(map(str, resolution)),
+                "mode": "full-frame" if budget == 1 else "tiled",
+                "tile_budget": budget,
+                "windows": len(tiler.windows(width, height)),
+                "fps": round(len(latencies) / sum(latencies), 2),
+                "latency": summarize(latencies),
+                "mean_detections": round(float(np.mean(counts)), 2),
+            })
+    scheduler.close()
+    for run in runs:
+        full_frame = next(other for other in runs if other["resolution"] == run["resolution"] and other["mode"] == "full-frame")
+        run["relative_throughput"] = round(run["fps"] / full_frame["fps"], 3)
+    return {
+        "model": model,
+        "random_weights": random_weights,
+        "compute": args.compute,
+        "max_batch": args.max_batch,
+        "overlap": args.overlap,
+        "runs": runs,
+    }
+
+
+def bench_decoder(args):
+    # Same net and blobs for both paths: the built-in DetectionOutput layer, and the graph cut at the raw
+    # SSD heads with the NumPy decoder in each NMS mode. Agreement is measured against the built-in boxes.
+    model, random_weights = resolve_model(args)
+    detector = caffe_ssd(args.prototxt, model).on(*compute_options()[args.compute])
+    net = detector.load()
+    width, height = args.resolution
+    preprocess = detector.preprocessor()
+    if args.frames_dir:
+        frames = load_frames(args.frames_dir, args.resolution, args.frames * args.batch)
+    else:
+        frames = synthetic_frames(args.resolution, args.frames * args.batch)
+    blobs = [np.concatenate([preprocess(frame) for frame in frames[i:i + args.batch]]) for i in range(0, len(frames), args.batch)]
+    paths = {"builtin": (["detection_out"], split_detections)}
+    for mode in args.modes:
+        paths[mode] = (list(SSD_OUTPUTS), SSDDecoder(args.score_threshold, args.nms_threshold, args.top_k, args.keep_top_k, nms=mode))
+    results, detections = {}, {}
+    for name, (outputs, decode) in paths.items():
+        forwards, decodes = [], []
+        detections[name] = []
+        for i in range(args.warmup + len(blobs) * args.repeat):
+            blob = blobs[i % len(blobs)]
+            start = time.perf_counter()
+            net.setInput(blob)
+            output = net.forward(outputs)
+            forwarded = time.perf_counter()
+            parts = decode(output if len(outputs) > 1 else output[0], len(blob))
+            decoded = time.perf_counter()
+            if i >= args.warmup:
+                forwards.append(forwarded - start)
+                decodes.append(decoded - forwarded)
+                if len(detections[name]) < len(frames):
+                    detections[name].extend(decode_detections(rows, width, height, args.threshold) for rows in parts)
+        results[name] = {"forward": summarize(forwards), "decode": summarize(decodes), "total_p50_ms": round(float(np.percentile(np.add(forwards, decodes), 50)) * 1000, 4)}
+    for name, result in results.items():
+        result["speedup"] = round(results["builtin"]["total_p50_ms"] / result["total_p50_ms"], 3)
+        ious = []
+        for expected, actual in zip(detections["builtin"], detections[name]):
+            ious.extend(compare_detections(expected, actual, args.iou_threshold)[0].tolist())
+        expected_count = sum(len(boxes) for boxes in detections["builtin"])
+        actual_count = sum(len(boxes) for boxes in detections[name])
+        result["agreement"] = {
+            "reference_detections": expected_count,
+            "detections": actual_count,
+            "recall": round(len(ious) / expected_count, 4) if expected_count else 1.0,
+            "precision": round(len(ious) / actual_count, 4) if actual_count else 1.0,
+            "mean_iou": round(float(np.mean(ious)), 4) if ious else None,
+        }
+    return {
+        "model": model,
+        "random_weights": random_weights,
+        "compute": args.compute,
+        "resolution": "x".join(map(str, args.resolution)),
+        "batch": args.batch,
+        "frames": len(frames) * args.repeat,
+        "decoder": {"score_threshold": args.score_threshold, "nms_threshold": args.nms_threshold, "top_k": args.top_k, "keep_top_k": args.keep_top_k},
+        "paths": results,
+    }
+
+
+def bench_startup(args):
+    root = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(args.repeat):
+        probe = subprocess.run([sys.executable, "-c", STARTUP_PROBE, ",".join(APP_MODULES)], cwd=root, capture_output=True, text=True, check=True)
+        samples.append(json.loads(probe.stdout.strip().splitlines()[-1]))
+    # Medians over fresh interpreters; the first run of each also pays for cold OS file caches.
+    report = {name: round(float(np.median([sample[name] for sample in samples])), 1) for name in ("framework_import_ms", "app_import_ms", "first_render_ms", "rerun_ms", "ready_ms")}
+    report["exceptions"] = sorted({message for sample in samples for message in sample["exceptions"]})
+    for name in ("matplotlib_loaded", "process_scheduler_loaded", "shared_memory_loaded"):
+        report[name] = any(sample[name] for sample in samples)
+    report["budget"] = {"app_import_ms": args.import_budget_ms, "first_render_ms": args.render_budget_ms}
+    report["within_budget"] = (
+        report["app_import_ms"] <= args.import_budget_ms
+        and report["first_render_ms"] <= args.render_budget_ms
+        and not report["exceptions"]
+        and not report["matplotlib_loaded"]
+        and not report["process_scheduler_loaded"]
+        and not report["shared_memory_loaded"]
+    )
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the object detection pipeline.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    preprocess = subparsers.add_parser("preprocess", help="compare blobFromImage with the preallocated preprocessing path")
+    preprocess.add_argument("--resolution", type=parse_resolution, default=(1280, 720), help="input frame size, e.g. 1280x720")
+    preprocess.add_argument("--frames", type=int, default=30, help="number of distinct synthetic frames")
+    preprocess.add_argument("--repeat", type=int, default=10, help="passes over the frame set")
+    preprocess.set_defaults(run=bench_preprocess)
+
+    transport = subparsers.add_parser("transport", help="compare per-frame copies with decoding into shared frame slots")
+    transport.add_argument("--resolutions", type=parse_resolution, nargs="+", default=[(1280, 720), (1920, 1080)], help="frame sizes to test")
+    transport.add_argument("--repeat", type=int, default=20, help="passes over the frame set")
+    transport.add_argument("--shared", action="store_true", help="back the frame slots with shared memory")
+    transport.set_defaults(run=bench_transport)
+
+    pipeline = subparsers.add_parser("pipeline", help="run the video_frame_callback stages headless and report latency percentiles")
+    pipeline.add_argument("--resolutions", type=parse_resolution, nargs="+", default=[(640, 480), (1280, 720)], help="frame sizes to test")
+    pipeline.add_argument("--streams", type=int, nargs="+", default=[1, 4], help="numbers of concurrent streams to test")
+    pipeline.add_argument("--frames", type=int, default=60, help="measured frames per stream")
+    pipeline.add_argument("--warmup", type=int, default=5, help="unmeasured frames per stream before timing starts")
+    pipeline.add_argument("--distinct-frames", type=int, default=10, help="synthetic or on-disk frames cycled through")
+    pipeline.add_argument("--frames-dir", help="directory of images to use instead of synthetic frames")
+    pipeline.add_argument("--threshold", type=float, default=0.5, help="score threshold applied after the forward pass")
+    pipeline.add_argument("--detector", choices=tuple(BACKENDS), default="caffe-ssd", help="registered detector backend; run once per detector to compare them")
+    pipeline.add_argument("--model", default=MODEL, help="caffemodel weights for caffe-ssd; a random one is generated if missing")
+    pipeline.add_argument("--prototxt", default=PROTOTXT)
+    pipeline.add_argument("--random-weights", action="store_true", help="always use randomly initialised weights")
+    pipeline.add_argument("--backend", choices=("thread", "process"), default="thread", help="run forward passes on a thread pool or in worker processes")
+    pipeline.add_argument("--pool-size", type=int, default=2, help="nets in the thread backend pool")
+    pipeline.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes for the process backend")
+    pipeline.add_argument("--max-batch", type=int, default=8)
+    pipeline.add_argument("--max-wait-ms", type=float, default=10)
+    pipeline.set_defaults(run=bench_pipeline)
+
+    precision = subparsers.add_parser("precision", help="compare reduced-precision variants of the Caffe model against FP32: latency speedup and detection agreement")
+    precision.add_argument("--modes", nargs="+", choices=("fp16", "int8"), default=["fp16", "int8"], help="reduced-precision modes to compare with fp32")
+    precision.add_argument("--compute", choices=tuple(compute_options()), default="OpenCV / CPU", help="OpenCV DNN backend / target")
+    precision.add_argument("--resolution", type=parse_resolution, default=(640, 480), help="input frame size")
+    precision.add_argument("--frames", type=int, default=20, help="synthetic or on-disk frames to compare on")
+    precision.add_argument("--frames-dir", help="directory of images to use instead of synthetic frames")
+    precision.add_argument("--calibration-dir", help="images for INT8 calibration; defaults to --frames-dir")
+    precision.add_argument("--repeat", type=int, default=3, help="timed passes over the frame set")
+    precision.add_argument("--warmup", type=int, default=3)
+    precision.add_argument("--threshold", type=float, default=0.5, help="score threshold applied before matching")
+    precision.add_argument("--iou-threshold", type=float, default=0.5, help="minimum IoU for two detections to agree")
+    precision.add_argument("--model", default=MODEL, help="caffemodel weights; a random one is generated if missing")
+    precision.add_argument("--prototxt", default=PROTOTXT)
+    precision.add_argument("--random-weights", action="store_true", help="always use randomly initialised weights")
+    precision.set_defaults(run=bench_precision)
+
+    tiling = subparsers.add_parser("tiling", help="compare tiled high-resolution detection with the full-frame path: throughput and detections per frame")
+    tiling.add_argument("--resolutions", type=parse_resolution, nargs="+", default=[(1280, 720), (1920, 1080)], help="frame sizes to test")
+    tiling.add_argument("--budgets", type=int, nargs="+", default=[4, 7, 10], help="tile budgets to test, including the full-frame window")
+    tiling.add_argument("--overlap", type=float, default=0.25, help="fraction of a tile shared with its neighbours")
+    tiling.add_argument("--frames", type=int, default=10, help="synthetic or on-disk frames cycled through")
+    tiling.add_argument("--frames-dir", help="directory of images to use instead of synthetic frames")
+    tiling.add_argument("--repeat", type=int, default=2, help="timed passes over the frame set")
+    tiling.add_argument("--warmup", type=int, default=2)
+    tiling.add_argument("--threshold", type=float, default=0.5, help="score threshold applied after merging")
+    tiling.add_argument("--nms-threshold", type=float, default=0.45, help="IoU above which detections from overlapping tiles are merged")
+    tiling.add_argument("--compute", choices=tuple(compute_options()), default="OpenCV / CPU", help="OpenCV DNN backend / target")
+    tiling.add_argument("--pool-size", type=int, default=2, help="nets in the thread backend pool")
+    tiling.add_argument("--max-batch", type=int, default=16, help="tiles of one frame share a forward when they fit")
+    tiling.add_argument("--max-wait-ms", type=float, default=10)
+    tiling.add_argument("--model", default=MODEL, help="caffemodel weights; a random one is generated if missing")
+    tiling.add_argument("--prototxt", default=PROTOTXT)
+    tiling.add_argument("--random-weights", action="store_true", help="always use randomly initialised weights")
+    tiling.set_defaults(run=bench_tiling)
+
+    decoder = subparsers.add_parser("decoder", help="compare the built-in DetectionOutput layer with the NumPy SSD decoder: latency and agreement")
+    decoder.add_argument("--modes", nargs="+", choices=NMS_MODES, default=list(NMS_MODES), help="NMS variants of the NumPy decoder to run")
+    decoder.add_argument("--resolution", type=parse_resolution, default=(640, 480), help="input frame size")
+    decoder.add_argument("--batch", type=int, default=1, help="images per forward")
+    decoder.add_argument("--frames", type=int, default=10, help="batches of synthetic or on-disk frames")
+    decoder.add_argument("--frames-dir", help="directory of images to use instead of synthetic frames")
+    decoder.add_argument("--repeat", type=int, default=3, help="timed passes over the batches")
+    decoder.add_argument("--warmup", type=int, default=3)
+    decoder.add_argument("--score-threshold", type=float, default=0.25, help="decoder candidate threshold, as in the prototxt")
+    decoder.add_argument("--nms-threshold", type=float, default=0.45)
+    decoder.add_argument("--top-k", type=int, default=100)
+    decoder.add_argument("--keep-top-k", type=int, default=100)
+    decoder.add_argument("--threshold", type=float, default=0.5, help="score threshold applied before matching")
+    decoder.add_argument("--iou-threshold", type=float, default=0.5, help="minimum IoU for two detections to agree")
+    decoder.add_argument("--compute", choices=tuple(compute_options()), default="OpenCV / CPU", help="OpenCV DNN backend / target")
+    decoder.add_argument("--model", default=MODEL, help="caffemodel weights; a random one is generated if missing")
+    decoder.add_argument("--prototxt", default=PROTOTXT)
+    decoder.add_argument("--random-weights", action="store_true", help="always use randomly initialised weights")
+    decoder.set_defaults(run=bench_decoder)
+
+    startup = subparsers.add_parser("startup", help="time imports and the first page render in fresh interpreters; exits 1 when over budget")
+    startup.add_argument("--repeat", type=int, default=3, help="fresh interpreters to take the median over")
+    startup.add_argument("--import-budget-ms", type=float, default=300, help="budget for importing the page's own modules")
+    startup.add_argument("--render-budget-ms", type=float, default=1500, help="budget for the first headless run of the page script")
+    startup.set_defaults(run=bench_startup)
+
+    for subparser in subparsers.choices.values():
+        subparser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+    result = args.run(args)
+    report = json.dumps(result, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    if result.get("within_budget") is False:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import numpy as np
+
+
+def corners(boxes):
+    # (N, 4) int32 view of the x0, y0, x1, y1 fields of a DETECTION_DTYPE array.
+    return boxes.view(np.int32).reshape(-1, 7)[:, 2:6]
+
+
+def iou_matrix(a, b):
+    # a: (N, 4), b: (M, 4) boxes as x0, y0, x1, y1 -> (N, M) intersection over union.
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    x0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y1 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def nms(boxes, scores, iou_threshold=0.45, classes=None):
+    # Greedy non-maximum suppression from one IoU matrix; with classes, boxes only suppress boxes of their own class.
+    # Returns the indices of the kept boxes, highest score first.
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    boxes = np.asarray(boxes)[order]
+    overlaps = np.triu(iou_matrix(boxes, boxes) > iou_threshold, k=1)
+    if classes is not None:
+        classes = np.asarray(classes)[order]
+        overlaps &= classes[:, None] == classes[None, :]
+    keep = np.ones(len(order), dtype=bool)
+    # Only boxes that overlap a lower-scored one can suppress anything
+    for i in np.flatnonzero(overlaps.any(axis=1)).tolist():
+        if keep[i]:
+            keep &= ~overlaps[i]
+    return order[keep]
+
+
+def soft_nms(boxes, scores, sigma=0.5, score_threshold=0.01, classes=None):
+    # Gaussian soft-NMS: instead of dropping overlapping boxes, each pick decays the scores of the rest by
+    # exp(-iou^2 / sigma). Returns the indices of the boxes still above score_threshold, highest first,
+    # and their decayed scores.
+    iou = iou_matrix(boxes, boxes)
+    if classes is not None:
+        classes = np.asarray(classes)
+        iou[classes[:, None] != classes[None, :]] = 0
+    scores = np.array(scores, dtype=np.float32)
+    remaining = np.ones(len(scores), dtype=bool)
+    keep = []
+    for _ in range(len(scores)):
+        i = int(np.argmax(np.where(remaining, scores, -np.inf)))
+        if not remaining[i] or scores[i] < score_threshold:
+            break
+        keep.append(i)
+        remaining[i] = False
+        scores[remaining] *= np.exp(-np.square(iou[i, remaining]) / sigma)
+    keep = np.asarray(keep, dtype=np.intp)
+    return keep, scores[keep]
@@ -0,0 +1,220 @@
+import contextlib
+import queue
+import statistics
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+def warm_up_net(backend, net, batch_sizes=(1,), runs=3):
+    # OpenCV initialises layers and allocates buffers on the first forward of each input shape.
+    # Returns (cold, warm) seconds: the first batch-1 forward and the median of the later ones.
+    timings = []
+    for batch_size in batch_sizes:
+        blob = np.zeros((batch_size, *backend.blob_shape), dtype=np.float32)
+        for _ in range(runs):
+            start = time.perf_counter()
+            backend.forward(net, blob)
+            timings.append((batch_size, time.perf_counter() - start))
+    single = [seconds for batch_size, seconds in timings if batch_size == batch_sizes[0]]
+    return single[0], statistics.median(single[1:] or single)
+
+
+class DetectorPool:
+    # Nets are loaded on demand, up to `size`, and shared by every session in the process.
+    def __init__(self, backend, size=2):
+        if size < 1:
+            raise ValueError(f"Detector pool size must be at least 1, got {size}")
+        self.backend = backend
+        self.size = size
+        self._idle: "queue.Queue[cv2.dnn.Net]" = queue.Queue()
+        self._loaded = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        net = self.backend.load()
+        self._loaded += 1
+        return net
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def acquire(self, timeout=None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._loaded < self.size:
+                return self._load()
+        return self._idle.get(timeout=timeout)
+
+    def release(self, net):
+        self._idle.put(net)
+
+    def warm_up(self, batch_sizes=(1,), runs=3):
+        # Loads every net of the pool and warms each one; returns (cold, warm) seconds of the first.
+        nets = [self.acquire() for _ in range(self.size)]
+        try:
+            return [warm_up_net(self.backend, net, batch_sizes, runs) for net in nets][0]
+        finally:
+            for net in nets:
+                self.release(net)
+
+    @contextlib.contextmanager
+    def checkout(self, timeout=None):
+        net = self.acquire(timeout=timeout)
+        try:
+            yield net
+        finally:
+            self.release(net)
+
+
+class InferenceRequest:
+    __slots__ = ("blob", "output", "error", "done")
+
+    def __init__(self, blob):
+        self.blob = blob
+        self.output = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class InferenceScheduler:
+    # Frames submitted from any session are stacked into one N x C x H x W blob per forward pass.
+    # With warm_up, the pool's nets are loaded and warmed on a background thread and `ready` is set
+    # once they are; requests submitted earlier simply wait for a net.
+    def __init__(self, pool, max_batch=8, max_wait_ms=10, metrics=None, warm_up=True):
+        if max_batch < 1:
+            raise ValueError(f"max_batch must be at least 1, got {max_batch}")
+        self.pool = pool
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.warmup = None
+        self.warmup_error = None
+        self._ready = threading.Event()
+        self._requests: "queue.Queue[InferenceRequest]" = queue.Queue()
+        self._workers = [
+            threading.Thread(target=self._run, name=f"inference-scheduler-{i}", daemon=True)
+            for i in range(pool.size)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._warm_up_thread = None
+        if warm_up:
+            self._warm_up_thread = threading.Thread(target=self._warm_up, name="inference-warmup", daemon=True)
+            self._warm_up_thread.start()
+        else:
+            self._ready.set()
+
+    @property
+    def pending(self):
+        return self._requests.qsize()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def _warm_up(self):
+        try:
+            cold, warm = self.pool.warm_up(batch_sizes=(1, self.max_batch))
+            self.warmup = {"cold_forward_ms": round(cold * 1000, 1), "warm_forward_ms": round(warm * 1000, 1)}
+            if self.metrics is not None:
+                self.metrics.observe("warmup_cold_forward", cold)
+                self.metrics.observe("warmup_warm_forward", warm)
+        except Exception as exc:
+            self.warmup_error = exc
+        finally:
+            self._ready.set()
+
+    @property
+    def accepts_frames(self):
+        return False
+
+    def submit(self, blob):
+        request = InferenceRequest(blob)
+        self._requests.put(request)
+        return request
+
+    def infer(self, blob, timeout=None):
+        request = self.submit(blob)
+        if not request.done.wait(timeout):
+            raise TimeoutError("Inference request timed out")
+        if request.error is not None:
+            raise request.error
+        return request.output
+
+    def close(self):
+        for _ in self._workers:
+            self._requests.put(None)
+        # An interpreter exiting while the warm-up is inside OpenCV aborts the process
+        if self._warm_up_thread is not None:
+            self._warm_up_thread.join()
+
+    def _collect(self):
+        first = self._requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                request = self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        buffer = None
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                shape = batch[0].blob.shape[1:]
+                if buffer is None or buffer.shape[1:] != shape:
+                    buffer = np.empty((self.max_batch, *shape), dtype=np.float32)
+                for i, request in enumerate(batch):
+                    buffer[i] = request.blob[0]
+                    # Finished requests may be cached; do not keep their input alive
+                    request.blob = None
+                backend = self.pool.backend
+                with self.pool.checkout() as net:
+                    start = time.perf_counter()
+                    output = backend.forward(net, buffer[:len(batch)])
+                if self.metrics is not None:
+                    self.metrics.observe("forward", time.perf_counter() - start)
+                    self.metrics.increment("inference_batches")
+                    self.metrics.increment("inference_frames", len(batch))
+                for request, rows in zip(batch, backend.decode(output, len(batch))):
+                    request.output = rows
+            except Exception as exc:
+                for request in batch:
+                    request.error = exc
+            finally:
+                for request in batch:
+                    request.done.set()
+
+
+def split_detections(output, num_images):
+    # detection_out rows are (image_id, class_id, score, x0, y0, x1, y1); empty slots come back as zero rows.
+    rows = output.reshape(-1, 7)
+    rows = rows[rows[:, 2] > 0]
+    if num_images == 1:
+        return [rows]
+    order = np.argsort(rows[:, 0], kind="stable")
+    rows = rows[order]
+    bounds = np.searchsorted(rows[:, 0], np.arange(1, num_images))
+    return np.split(rows, bounds)
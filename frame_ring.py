@@ -0,0 +1,110 @@
+import atexit
+import threading
+import weakref
+
+import cv2
+import numpy as np
+
+
+class FrameRing:
+    # Fixed-size BGR frame slots in one buffer, shared memory when inference workers need to read them.
+    def __init__(self, num_slots, slot_bytes, shared=False):
+        self.num_slots = num_slots
+        self.slot_bytes = slot_bytes
+        self.shared = shared
+        if shared:
+            # Only the process inference backend shares frames, so the thread backend never imports this
+            from multiprocessing import shared_memory
+
+            self._segment = shared_memory.SharedMemory(create=True, size=num_slots * slot_bytes)
+            self.buffer = self._segment.buf
+            atexit.register(self.close)
+        else:
+            self._segment = None
+            self.buffer = np.empty(num_slots * slot_bytes, dtype=np.uint8)
+        self._free = list(range(num_slots))
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self._segment.name if self._segment is not None else None
+
+    @property
+    def available(self):
+        return len(self._free)
+
+    def view(self, slot, shape):
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.buffer, offset=slot * self.slot_bytes)
+
+    def allocate(self, count):
+        with self._lock:
+            if len(self._free) < count:
+                return None
+            slots, self._free = self._free[:count], self._free[count:]
+            return slots
+
+    def release(self, slots):
+        with self._lock:
+            self._free.extend(slots)
+
+    def stream(self, depth=3):
+        # Falls back to a private ring when every shared slot is taken.
+        slots = self.allocate(depth)
+        if slots is None:
+            return StreamFrames(FrameRing(depth, self.slot_bytes), list(range(depth)))
+        frames = StreamFrames(self, slots)
+        weakref.finalize(frames, self.release, slots)
+        return frames
+
+    def close(self):
+        if self._segment is not None and self.buffer is not None:
+            self.buffer = None
+            self._segment.close()
+            self._segment.unlink()
+
+
+class StreamFrames:
+    # A stream's share of a FrameRing. A slot stays reserved while an inference request that reads it is in flight.
+    def __init__(self, ring, slots):
+        self.ring = ring
+        self.slots = slots
+        self._held = [None] * len(slots)
+        self._next = -1
+
+    @property
+    def shared(self):
+        return self.ring.shared
+
+    def write(self, frame):
+        height, width = frame.height, frame.width
+        if height * width * 3 > self.ring.slot_bytes:
+            # Move this stream to a private ring sized for the frame. Streams that leave a shared ring send
+            # preprocessed blobs to the workers instead; their shared slots return when the stream is dropped.
+            self.ring = FrameRing(len(self.slots), height * width * 3)
+            self.slots = list(range(len(self.slots)))
+            self._held = [None] * len(self.slots)
+            self._next = -1
+        for _ in self.slots:
+            self._next = (self._next + 1) % len(self.slots)
+            request = self._held[self._next]
+            if request is None or request.done.is_set():
+                break
+        else:
+            raise RuntimeError("Every frame slot of this stream is held by an inference request")
+        self._held[self._next] = None
+        slot = self.slots[self._next]
+        image = self.ring.view(slot, (height, width, 3))
+        decode_into(frame, image)
+        return slot, image
+
+    def hold(self, slot, request):
+        self._held[self.slots.index(slot)] = request
+
+
+def decode_into(frame, image):
+    if frame.format.name == "yuv420p" and frame.width % 2 == 0 and frame.height % 2 == 0:
+        # Convert the I420 planes straight into the slot instead of materialising a BGR copy first.
+        cv2.cvtColor(frame.to_ndarray(), cv2.COLOR_YUV2BGR_I420, dst=image)
+    else:
+        np.copyto(image, frame.to_ndarray(format="bgr24"))
+    return image
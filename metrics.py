@@ -0,0 +1,158 @@
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Upper bounds in seconds, Prometheus style; samples above the last bound land in +Inf.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class LatencyHistogram:
+    # Cumulative bucket counts for export plus a ring of recent samples for percentiles.
+    def __init__(self, window=512):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._recent = np.zeros(window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self._recent[self.count % len(self._recent)] = seconds
+            self.count += 1
+            self.sum += seconds
+
+    def percentiles(self, quantiles=(50, 95, 99)):
+        with self._lock:
+            recent = self._recent[:min(self.count, len(self._recent))].copy()
+        if not len(recent):
+            return [0.0] * len(quantiles)
+        return np.percentile(recent, quantiles).tolist()
+
+    def summary(self):
+        p50, p95, p99 = self.percentiles()
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(p50 * 1000, 3),
+            "p95_ms": round(p95 * 1000, 3),
+            "p99_ms": round(p99 * 1000, 3),
+        }
+
+
+class Metrics:
+    # Stage histograms, counters and gauges. A session registry forwards every sample and count to its
+    # parent, so the process-wide registry sees all sessions; gauges stay with the registry they are set on.
+    def __init__(self, parent=None, window=512):
+        self.parent = parent
+        self.window = window
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stages.setdefault(stage, LatencyHistogram(self.window))
+        return histogram
+
+    def observe(self, stage, seconds):
+        self.histogram(stage).observe(seconds)
+        if self.parent is not None:
+            self.parent.observe(stage, seconds)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        if self.parent is not None:
+            self.parent.increment(name, value)
+
+    def gauge(self, name, read, labels=None):
+        # labels: optional {label: value}; gauges sharing a name are exported as one metric with a series per label set.
+        if labels:
+            name += "{" + ",".join(f'{label}="{_escape_label(value)}"' for label, value in labels.items()) + "}"
+        self.gauges[name] = read
+
+    def timer(self):
+        return StageTimer(self)
+
+    def snapshot(self):
+        return {
+            "stages": {stage: histogram.summary() for stage, histogram in list(self.stages.items())},
+            "counters": dict(self.counters),
+            "gauges": {name: read() for name, read in list(self.gauges.items())},
+        }
+
+    def prometheus(self, prefix="object_detection"):
+        lines = [f"# TYPE {prefix}_stage_seconds histogram"]
+        for stage, histogram in list(self.stages.items()):
+            cumulative = 0
+            for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), histogram.buckets):
+                cumulative += count
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        for name, value in list(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        typed = set()
+        for name, read in list(self.gauges.items()):
+            metric = name.split("{", 1)[0]
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {prefix}_{metric} gauge")
+            lines.append(f"{prefix}_{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    # Times consecutive stages of one frame: each lap() records the time since the previous lap.
+    __slots__ = ("metrics", "start", "last")
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.start = self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.metrics.observe(stage, now - self.last)
+        self.last = now
+
+    def stop(self, stage="total"):
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe(stage, elapsed)
+        return elapsed
+
+
+def serve_metrics(metrics, port, host="0.0.0.0"):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = metrics.prometheus().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(metrics.snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,46 @@
+import cv2
+import numpy as np
+
+
+class MotionScore:
+    # Mean absolute difference (0-255) between a small grayscale thumbnail of the frame and a reference,
+    # optionally only over the non-zero pixels of a thumbnail-sized mask.
+    def __init__(self, size=(64, 36)):
+        self.size = size
+        self.reference = None
+        self._small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        self._gray = np.empty((size[1], size[0]), dtype=np.uint8)
+
+    def thumbnail(self, image):
+        cv2.resize(image, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+
+    def __call__(self, image, mask=None):
+        gray = self.thumbnail(image)
+        if self.reference is None:
+            return float("inf")
+        return float(cv2.mean(cv2.absdiff(gray, self.reference), mask=mask)[0])
+
+    def reset(self):
+        # Makes the thumbnail of the last scored frame the new reference.
+        self.reference = self._gray.copy()
+
+
+class MotionGate:
+    # Lets a frame through to the detector only when it differs from the last frame let through by more
+    # than `threshold`, so a static scene costs a thumbnail diff per frame instead of a forward pass.
+    # After max_skipped frames in a row one is let through anyway, to pick up slow changes.
+    def __init__(self, motion_score, threshold=2.0, max_skipped=150):
+        self.motion_score = motion_score
+        self.enabled = False
+        self.threshold = threshold
+        self.max_skipped = max_skipped
+        self.skipped = 0
+
+    def changed(self, image, mask=None):
+        if self.motion_score(image, mask) > self.threshold or self.skipped >= self.max_skipped:
+            self.motion_score.reset()
+            self.skipped = 0
+            return True
+        self.skipped += 1
+        return False
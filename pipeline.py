@@ -0,0 +1,153 @@
+from typing import List, NamedTuple
+
+import cv2
+import numpy as np
+
+from boxes import corners
+
+CLASSES = [
+    "background",
+    "aeroplane",
+    "bicycle",
+    "bird",
+    "boat",
+    "bottle",
+    "bus",
+    "car",
+    "cat",
+    "chair",
+    "cow",
+    "diningtable",
+    "dog",
+    "horse",
+    "motorbike",
+    "person",
+    "pottedplant",
+    "sheep",
+    "sofa",
+    "train",
+    "tvmonitor",
+]
+
+
+class Detection(NamedTuple):
+    class_id: int
+    label: str
+    score: float
+    box: np.ndarray
+    track_id: int = -1
+
+
+# Every field is 4 bytes wide so the array can also be viewed as an (N, 7) int32 block.
+DETECTION_DTYPE = np.dtype([
+    ("class_id", np.int32),
+    ("score", np.float32),
+    ("x0", np.int32),
+    ("y0", np.int32),
+    ("x1", np.int32),
+    ("y1", np.int32),
+    ("track_id", np.int32),
+])
+
+
+def class_limits(num_classes, score_threshold, settings=None):
+    # Per-class lookup arrays for decode_detections. settings maps column name to one value per class from
+    # class 1 on: "enabled", "min_score" (0-1, None for score_threshold) and "max_boxes" (None or 0 for no cap).
+    # Background and disabled classes get an infinite threshold.
+    thresholds = np.full(num_classes, score_threshold, dtype=np.float32)
+    caps = np.zeros(num_classes, dtype=np.intp)
+    thresholds[0] = np.inf
+    if settings is not None:
+        for class_id, (enabled, min_score, max_boxes) in enumerate(zip(settings["enabled"], settings["min_score"], settings["max_boxes"]), start=1):
+            if not enabled:
+                thresholds[class_id] = np.inf
+            elif min_score is not None and min_score == min_score:
+                thresholds[class_id] = min_score
+            if max_boxes is not None and max_boxes == max_boxes:
+                caps[class_id] = max_boxes
+    return thresholds, caps
+
+
+def cap_per_class(class_ids, scores, caps):
+    # Indices of the rows to keep, in their original order: the caps[class_id] highest scores of each class,
+    # every row of classes whose cap is 0.
+    order = np.lexsort((-scores, class_ids))
+    sorted_ids = class_ids[order].astype(np.intp)
+    rank = np.arange(len(order)) - np.searchsorted(sorted_ids, sorted_ids)
+    limit = caps[sorted_ids]
+    return np.sort(order[(limit <= 0) | (rank < limit)])
+
+
+def decode_detections(rows, width, height, score_threshold, max_per_class=None):
+    # rows: (N, 7) detection_out rows -> structured array of boxes in pixel coordinates.
+    # score_threshold is one minimum score or, like max_per_class, an array indexed by class_id (see class_limits);
+    # rows are filtered with one lookup before anything else is decoded.
+    if np.ndim(score_threshold):
+        rows = rows[rows[:, 2] >= score_threshold[rows[:, 1].astype(np.intp)]]
+    else:
+        rows = rows[rows[:, 2] >= score_threshold]
+    if max_per_class is not None and len(rows):
+        rows = rows[cap_per_class(rows[:, 1], rows[:, 2], max_per_class)]
+    boxes = np.empty(len(rows), dtype=DETECTION_DTYPE)
+    boxes["class_id"] = rows[:, 1]
+    boxes["score"] = rows[:, 2]
+    corners(boxes)[:] = rows[:, 3:7] * np.array([width, height, width, height], dtype=np.float32)
+    boxes["track_id"] = -1
+    return boxes
+
+
+def to_detections(boxes, labels=CLASSES) -> List[Detection]:
+    columns = (boxes["class_id"].tolist(), boxes["score"].tolist(), corners(boxes), boxes["track_id"].tolist())
+    return [
+        Detection(class_id=class_id, label=labels[class_id], score=score, box=box, track_id=track_id)
+        for class_id, score, box, track_id in zip(*columns)
+    ]
+
+
+def label_colors(num_classes=len(CLASSES)):
+    # BGR gradient from #5007E3 to #03A9F4, one color per class.
+    return np.linspace((227, 7, 80), (244, 169, 3), num_classes)
+
+
+class DetectionRenderer:
+    # Captions and BGR color tuples are built once per class instead of on every frame.
+    def __init__(self, colors, labels=CLASSES):
+        self.colors = [tuple(float(channel) for channel in color) for color in colors]
+        self.captions = [[f"{label}: {percent}%" for percent in range(101)] for label in labels]
+
+    def draw(self, image, boxes, show_track_ids=False):
+        if not len(boxes):
+            return image
+        percents = np.rint(boxes["score"] * 100).astype(np.intp).clip(0, 100)
+        text_y = np.where(boxes["y0"] - 15 > 15, boxes["y0"] - 15, boxes["y0"] + 15)
+        columns = (boxes["class_id"], percents, boxes["x0"], boxes["y0"], boxes["x1"], boxes["y1"], text_y, boxes["track_id"])
+        for class_id, percent, xmin, ymin, xmax, ymax, y, track_id in zip(*(column.tolist() for column in columns)):
+            color = self.colors[class_id]
+            caption = self.captions[class_id][percent]
+            if show_track_ids and track_id >= 0:
+                caption = f"#{track_id} {caption}"
+            cv2.rectangle(image, (xmin, ymin), (xmax, ymax), color, 4)
+            cv2.putText(image, caption, (xmin, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2,)
+        return image
+
+
+class Preprocessor:
+    # Per-stream resize, mean subtraction, scaling and HWC -> CHW conversion into reused buffers.
+    # scale and mean are scalars or per-channel (B, G, R) values; swap_rb feeds the channels as RGB.
+    def __init__(self, size=(300, 300), scale=0.007843, mean=127.5, swap_rb=False):
+        width, height = size
+        self.size = size
+        self.scale = np.asarray(scale, dtype=np.float32).reshape(-1, 1, 1)
+        self.mean = np.asarray(mean, dtype=np.float32).reshape(-1, 1, 1)
+        self.swap_rb = swap_rb
+        self.resized = np.empty((height, width, 3), dtype=np.uint8)
+        self.blob = np.empty((1, 3, height, width), dtype=np.float32)
+
+    def __call__(self, image, out=None):
+        # out: optional (3, H, W) float32 destination, e.g. a row of a batch buffer.
+        cv2.resize(image, self.size, dst=self.resized)
+        chw = self.blob[0] if out is None else out
+        hwc = self.resized[..., ::-1] if self.swap_rb else self.resized
+        np.subtract(hwc.transpose(2, 0, 1), self.mean, out=chw, dtype=np.float32)
+        np.multiply(chw, self.scale, out=chw)
+        return self.blob if out is None else out
@@ -0,0 +1,277 @@
+import atexit
+import contextlib
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+import types
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from detector import InferenceRequest, warm_up_net
+
+
+def _load_batch(batch, buffer, blobs, frames, frame_slot_bytes, preprocess):
+    for i, (slot, frame_slot, height, width) in enumerate(batch):
+        if frame_slot is None:
+            buffer[i] = blobs[slot]
+        else:
+            image = np.ndarray((height, width, 3), dtype=np.uint8, buffer=frames.buf, offset=frame_slot * frame_slot_bytes)
+            preprocess(image, out=buffer[i])
+
+
+def _worker_main(worker, backend, shm_name, slot_shape, num_slots, frames_name, frame_slot_bytes, tasks, results, max_batch, max_wait, threads):
+    import cv2
+
+    cv2.setNumThreads(threads)
+    try:
+        net = backend.load()
+        # Spawned workers share the parent's resource tracker, which unlinks the segments when the parent closes them.
+        segment = shared_memory.SharedMemory(name=shm_name)
+        frames = shared_memory.SharedMemory(name=frames_name) if frames_name else None
+        blobs = np.ndarray((num_slots, *slot_shape), dtype=np.float32, buffer=segment.buf)
+        buffer = np.empty((max_batch, *slot_shape), dtype=np.float32)
+        preprocess = backend.preprocessor()
+        warmup = warm_up_net(backend, net, batch_sizes=(1, max_batch))
+    except Exception as exc:
+        results.put(("failed", worker, repr(exc), None))
+        return
+    results.put(("ready", worker, warmup, None))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        batch = [task]
+        deadline = time.monotonic() + max_wait
+        while len(batch) < max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                task = tasks.get(timeout=remaining) if remaining > 0 else tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is None:
+                tasks.put(None)
+                break
+            batch.append(task)
+        # Lets the parent fail exactly these requests if this worker dies before answering them
+        results.put(("taken", worker, None, [task[0] for task in batch]))
+        try:
+            start = time.perf_counter()
+            _load_batch(batch, buffer, blobs, frames, frame_slot_bytes, preprocess)
+            loaded = time.perf_counter()
+            output = backend.forward(net, buffer[:len(batch)])
+            timings = (loaded - start, time.perf_counter() - loaded)
+            rows = backend.decode(output, len(batch))
+            results.put(("done", worker, timings, [(task[0], part.tobytes()) for task, part in zip(batch, rows)]))
+        except Exception as exc:
+            results.put(("error", worker, repr(exc), [task[0] for task in batch]))
+    del blobs
+    segment.close()
+    if frames is not None:
+        frames.close()
+
+
+@contextlib.contextmanager
+def _without_main_module():
+    # Streamlit executes the page as __main__, and spawn would re-run it in every worker.
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+class ProcessScheduler:
+    # Drop-in alternative to InferenceScheduler that runs forward passes in worker processes.
+    # Blobs are copied once into a shared-memory slot; only slot indices and detection rows are pickled.
+    # With a shared FrameRing, workers can also read decoded frames in place and preprocess them themselves.
+    def __init__(self, backend, workers=2, max_batch=8, max_wait_ms=10, threads_per_worker=1, frame_ring=None, metrics=None):
+        if frame_ring is not None and not frame_ring.shared:
+            raise ValueError("ProcessScheduler needs a FrameRing created with shared=True")
+        self.backend = backend
+        self.max_batch = max_batch
+        self.slot_shape = slot_shape = backend.blob_shape
+        self.frame_ring = frame_ring
+        self.metrics = metrics
+        num_slots = workers * max_batch * 2
+        self._segment = shared_memory.SharedMemory(create=True, size=num_slots * int(np.prod(slot_shape)) * 4)
+        self._slots = np.ndarray((num_slots, *slot_shape), dtype=np.float32, buffer=self._segment.buf)
+        self._free: "queue.Queue[int]" = queue.Queue()
+        for slot in range(num_slots):
+            self._free.put(slot)
+        self._requests = [None] * num_slots
+        # Index of the worker running each slot's request, once that worker has taken it
+        self._taken = [None] * num_slots
+        context = multiprocessing.get_context("spawn")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._processes = [
+            context.Process(
+                target=_worker_main,
+                args=(
+                    i, backend, self._segment.name, self.slot_shape, num_slots,
+                    frame_ring.name if frame_ring is not None else None, frame_ring.slot_bytes if frame_ring is not None else 0,
+                    self._tasks, self._results, max_batch, max_wait_ms / 1000, threads_per_worker,
+                ),
+                name=f"inference-worker-{i}",
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+        try:
+            with _without_main_module():
+                for process in self._processes:
+                    process.start()
+        except BaseException:
+            for process in self._processes:
+                if process.is_alive():
+                    process.terminate()
+            self._release_segment()
+            raise
+        self.workers_ready = 0
+        self.warmup = None
+        self.warmup_error = None
+        self._ready = threading.Event()
+        self._exited = set()
+        self._closed = False
+        self._reader = threading.Thread(target=self._read_results, name="inference-results", daemon=True)
+        self._reader.start()
+        atexit.register(self.close)
+
+    @property
+    def pending(self):
+        return len(self._requests) - self._free.qsize()
+
+    @property
+    def ready(self):
+        # Set once every worker has loaded and warmed its net, or as soon as one has failed to (see warmup_error).
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def _check_alive(self):
+        if len(self._exited) == len(self._processes):
+            raise RuntimeError(f"Every inference worker has exited: {self.warmup_error}")
+
+    def submit(self, blob, timeout=None):
+        if blob.shape[1:] != self.slot_shape:
+            raise ValueError(f"Expected a blob of shape (1, {', '.join(map(str, self.slot_shape))}), got {blob.shape}")
+        self._check_alive()
+        slot = self._free.get(timeout=timeout)
+        # The blob is copied into the slot right away, so the request does not keep it alive
+        request = InferenceRequest(None)
+        self._requests[slot] = request
+        self._slots[slot] = blob[0]
+        self._tasks.put((slot, None, 0, 0))
+        return request
+
+    @property
+    def accepts_frames(self):
+        return self.frame_ring is not None
+
+    def submit_frame(self, frame_slot, shape, timeout=None):
+        # The frame slot must not be rewritten until the returned request is done.
+        self._check_alive()
+        slot = self._free.get(timeout=timeout)
+        request = InferenceRequest(None)
+        self._requests[slot] = request
+        self._tasks.put((slot, frame_slot, shape[0], shape[1]))
+        return request
+
+    def infer(self, blob, timeout=None):
+        request = self.submit(blob, timeout=timeout)
+        if not request.done.wait(timeout):
+            raise TimeoutError("Inference request timed out")
+        if request.error is not None:
+            raise request.error
+        return request.output
+
+    def _finish(self, slot, output=None, error=None):
+        request = self._requests[slot]
+        if request is None:
+            # Already failed, e.g. when every worker had exited
+            return
+        self._requests[slot] = None
+        self._taken[slot] = None
+        self._free.put(slot)
+        request.output = output
+        request.error = error
+        request.done.set()
+
+    def _worker_exited(self, worker, error):
+        # Fails the requests the worker had taken; queued ones stay for the others, unless none is left.
+        if self._processes[worker] in self._exited:
+            return
+        self._exited.add(self._processes[worker])
+        if self.warmup_error is None:
+            self.warmup_error = error
+        if self.metrics is not None:
+            self.metrics.increment("inference_worker_failures")
+        self._ready.set()
+        everything = len(self._exited) == len(self._processes)
+        for slot, request in enumerate(self._requests):
+            if request is not None and (everything or self._taken[slot] == worker):
+                self._finish(slot, error=error)
+
+    def _read_results(self):
+        while True:
+            try:
+                kind, worker, detail, payload = self._results.get(timeout=1)
+            except queue.Empty:
+                if not self._closed:
+                    for worker, process in enumerate(self._processes):
+                        if process not in self._exited and not process.is_alive():
+                            self._worker_exited(worker, RuntimeError(f"Inference worker {process.name} exited with code {process.exitcode}"))
+                continue
+            except (EOFError, OSError):
+                return
+            if kind == "taken":
+                for slot in payload:
+                    if self._requests[slot] is not None:
+                        self._taken[slot] = worker
+            elif kind == "failed":
+                self._worker_exited(worker, RuntimeError(f"Inference worker failed to start: {detail}"))
+            elif kind == "ready":
+                cold, warm = detail
+                self.workers_ready += 1
+                if self.warmup is None:
+                    self.warmup = {"cold_forward_ms": round(cold * 1000, 1), "warm_forward_ms": round(warm * 1000, 1)}
+                if self.metrics is not None:
+                    self.metrics.observe("warmup_cold_forward", cold)
+                    self.metrics.observe("warmup_warm_forward", warm)
+                if self.workers_ready == len(self._processes):
+                    self._ready.set()
+            elif kind == "done":
+                for slot, rows in payload:
+                    self._finish(slot, output=np.frombuffer(rows, dtype=np.float32).reshape(-1, 7))
+                if self.metrics is not None:
+                    self.metrics.observe("worker_preprocess", detail[0])
+                    self.metrics.observe("forward", detail[1])
+                    self.metrics.increment("inference_batches")
+                    self.metrics.increment("inference_frames", len(payload))
+            elif kind == "error":
+                for slot in payload:
+                    self._finish(slot, error=RuntimeError(f"Inference worker failed: {detail}"))
+            elif kind == "closed":
+                return
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+        self._results.put(("closed", None, None, None))
+        self._reader.join(timeout=5)
+        self._release_segment()
+
+    def _release_segment(self):
+        del self._slots
+        self._segment.close()
+        self._segment.unlink()
@@ -0,0 +1,98 @@
+import collections
+import hashlib
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class DetectionCache:
+    # LRU of inference requests keyed by model and input content; entries expire `ttl` seconds after they
+    # were stored. A request that is still in flight is shared with identical submissions instead of
+    # running twice, and failed requests are never served.
+    def __init__(self, maxsize=256, ttl=30.0, tolerance=0, thumbnail_size=(64, 64), metrics=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.tolerance = tolerance
+        self.thumbnail_size = thumbnail_size
+        self.metrics = metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, model_id, array):
+        # Exact hash of the array's bytes, e.g. a preprocessed blob or a decoded frame.
+        return model_id, hashlib.blake2b(np.ascontiguousarray(array).data, digest_size=16).digest()
+
+    def image_key(self, model_id, image):
+        # With a tolerance, hashes a small thumbnail quantised in steps of `tolerance` grey levels,
+        # so sensor noise on an unchanged scene still hits.
+        if not self.tolerance:
+            return self.key(model_id, image)
+        thumbnail = cv2.resize(image, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+        return self.key(model_id, thumbnail // self.tolerance)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored, request = entry
+                if now - stored > self.ttl:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                elif request.done.is_set() and request.error is not None:
+                    del self._entries[key]
+                    entry = None
+                else:
+                    self._entries.move_to_end(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if self.metrics is not None:
+            self.metrics.increment("result_cache_hits" if entry is not None else "result_cache_misses")
+        return None if entry is None else entry[1]
+
+    def put(self, key, request):
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (time.monotonic(), request)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        if evicted and self.metrics is not None:
+            self.metrics.increment("result_cache_evictions", evicted)
+
+    def submit(self, key, submit):
+        # Returns the cached request for key, or calls submit() and caches the request it returns.
+        request = self.get(key)
+        if request is None:
+            request = submit()
+            self.put(key, request)
+        return request
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "cache_entries": len(self._entries),
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "cache_evictions": self.evictions,
+            "cache_expirations": self.expirations,
+        }
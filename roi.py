@@ -0,0 +1,70 @@
+import cv2
+import numpy as np
+
+
+def parse_polygons(text):
+    # One polygon per line as space-separated "x,y" points, with x and y given as fractions of the frame
+    # width and height, e.g. "0.1,0.5 0.6,0.5 0.6,1 0.1,1". Blank lines are ignored.
+    polygons = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            points = np.array([[float(value) for value in point.split(",")] for point in line.split()], dtype=np.float32)
+        except ValueError:
+            raise ValueError(f"Line {number}: expected points written as x,y") from None
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+            raise ValueError(f"Line {number}: a region needs at least three x,y points")
+        if points.min() < 0 or points.max() > 1:
+            raise ValueError(f"Line {number}: coordinates are fractions of the frame size between 0 and 1")
+        polygons.append(points)
+    return polygons
+
+
+class RegionOfInterest:
+    # Polygons in frame-relative coordinates, so they survive the governor rescaling the frame. The detector
+    # only sees the bounding rectangle of all polygons, and detections are kept when their centre lies inside one.
+    def __init__(self, polygons=()):
+        self.polygons = list(polygons)
+        self._cache = {}
+
+    def __bool__(self):
+        return bool(self.polygons)
+
+    def _scaled(self, width, height):
+        key = (width, height, tuple(polygon.tobytes() for polygon in self.polygons))
+        if key not in self._cache:
+            points = [np.rint(polygon * (width - 1, height - 1)).astype(np.int32) for polygon in self.polygons]
+            mask = np.zeros((height, width), dtype=np.uint8)
+            cv2.fillPoly(mask, points, 255)
+            stacked = np.concatenate(points)
+            x0, y0 = stacked.min(axis=0).tolist()
+            x1, y1 = (stacked.max(axis=0) + 1).tolist()
+            self._cache = {key: (points, mask, (x0, y0, x1, y1))}
+        return self._cache[key]
+
+    def mask(self, width, height):
+        return self._scaled(width, height)[1]
+
+    def bounds(self, width, height):
+        # x0, y0, x1, y1 pixel rectangle enclosing every polygon.
+        return self._scaled(width, height)[2]
+
+    def area_fraction(self):
+        # Share of the frame the detector sees when cropping to bounds(); 1.0 without regions.
+        if not self.polygons:
+            return 1.0
+        stacked = np.concatenate(self.polygons)
+        return float(np.prod(stacked.max(axis=0) - stacked.min(axis=0)))
+
+    def contains(self, boxes, width, height):
+        # Boolean mask over a DETECTION_DTYPE array: box centre inside any polygon.
+        mask = self.mask(width, height)
+        x = ((boxes["x0"] + boxes["x1"]) // 2).clip(0, width - 1)
+        y = ((boxes["y0"] + boxes["y1"]) // 2).clip(0, height - 1)
+        return mask[y, x] > 0
+
+    def draw(self, image, color=(3, 169, 244)):
+        height, width = image.shape[:2]
+        cv2.polylines(image, self._scaled(width, height)[0], True, color, 2)
+        return image
@@ -0,0 +1,90 @@
+import numpy as np
+
+from boxes import nms, soft_nms
+from pipeline import cap_per_class
+
+# Raw SSD heads the decoder reads instead of the DetectionOutput layer
+SSD_OUTPUTS = ("mbox_loc", "mbox_conf_flatten", "mbox_priorbox")
+NMS_MODES = ("class", "agnostic", "soft")
+
+
+class PriorTable:
+    # Prior centres, sizes and variances from an mbox_priorbox output, laid out for CENTER_SIZE decoding.
+    # The priors only depend on the input size, so one table serves every forward.
+    def __init__(self, priorbox):
+        priors = priorbox.reshape(2, -1, 4)
+        corners, self.variances = priors[0], priors[1]
+        self.size = corners[:, 2:] - corners[:, :2]
+        self.centre = corners[:, :2] + self.size / 2
+        self.shape = priorbox.shape
+
+    def __len__(self):
+        return len(self.size)
+
+    def decode(self, loc, priors):
+        # loc: (K, 4) offsets of the priors at indices `priors` -> (K, 4) x0, y0, x1, y1 boxes.
+        variances = self.variances[priors]
+        centre = self.centre[priors] + loc[:, :2] * variances[:, :2] * self.size[priors]
+        half = self.size[priors] * np.exp(loc[:, 2:] * variances[:, 2:]) / 2
+        return np.concatenate([centre - half, centre + half], axis=1)
+
+
+class SSDDecoder:
+    # Replaces the DetectionOutput layer for nets cut at SSD_OUTPUTS. Class scores under score_threshold
+    # are dropped before any box is decoded, which leaves a small fraction of the priors; then each class
+    # keeps its top_k candidates, NMS runs per image and each image keeps its keep_top_k best boxes.
+    # nms: "class" suppresses within a class as DetectionOutput does, "agnostic" across classes, and
+    # "soft" decays overlapping scores (Gaussian, soft_sigma) instead of dropping them.
+    # Settings are plain attributes and are read on every call, so they can be changed at runtime.
+    def __init__(self, score_threshold=0.25, nms_threshold=0.45, top_k=100, keep_top_k=100, nms="class", soft_sigma=0.5):
+        if nms not in NMS_MODES:
+            raise ValueError(f"Unknown NMS mode {nms!r}, expected one of {', '.join(NMS_MODES)}")
+        self.score_threshold = score_threshold
+        self.nms_threshold = nms_threshold
+        self.top_k = top_k
+        self.keep_top_k = keep_top_k
+        self.nms = nms
+        self.soft_sigma = soft_sigma
+        self._priors = None
+
+    def priors(self, priorbox):
+        if self._priors is None or self._priors.shape != priorbox.shape:
+            self._priors = PriorTable(priorbox)
+        return self._priors
+
+    def __call__(self, output, num_images):
+        loc, conf, priorbox = output
+        priors = self.priors(priorbox)
+        loc = loc.reshape(num_images, len(priors), 4)
+        conf = conf.reshape(num_images, len(priors), -1)
+        num_classes = conf.shape[-1]
+        # Class 0 is the background; a view, so the threshold is the only pass over all scores
+        scores = conf[:, :, 1:]
+        images, prior_ids, columns = np.nonzero(scores > self.score_threshold)
+        class_ids = columns + 1
+        confidences = scores[images, prior_ids, columns]
+        # top_k per image and class, as DetectionOutput does before NMS
+        groups = images * num_classes + class_ids
+        keep = cap_per_class(groups, confidences, np.full(num_images * num_classes, self.top_k, dtype=np.intp))
+        images, prior_ids, class_ids, confidences = images[keep], prior_ids[keep], class_ids[keep], confidences[keep]
+        boxes = priors.decode(loc[images, prior_ids], prior_ids)
+        parts = []
+        bounds = np.searchsorted(images, np.arange(num_images + 1))
+        for image_id in range(num_images):
+            start, end = bounds[image_id], bounds[image_id + 1]
+            kept, kept_scores = self._suppress(boxes[start:end], confidences[start:end], class_ids[start:end])
+            kept, kept_scores = kept[:self.keep_top_k], kept_scores[:self.keep_top_k]
+            rows = np.empty((len(kept), 7), dtype=np.float32)
+            rows[:, 0] = image_id
+            rows[:, 1] = class_ids[start:end][kept]
+            rows[:, 2] = kept_scores
+            rows[:, 3:] = boxes[start:end][kept]
+            parts.append(rows)
+        return parts
+
+    def _suppress(self, boxes, scores, class_ids):
+        # Indices into boxes, highest score first, and their final scores.
+        if self.nms == "soft":
+            return soft_nms(boxes, scores, self.soft_sigma, self.score_threshold, classes=class_ids)
+        kept = nms(boxes, scores, self.nms_threshold, classes=class_ids if self.nms == "class" else None)
+        return kept, scores[kept]
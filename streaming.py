@@ -0,0 +1,205 @@
+import collections
+import threading
+
+
+class StreamGate:
+    # Latest-frame-wins admission for one stream: while the previous frame is still being
+    # inferred, new frames skip inference and can be drawn with the last known detections.
+    # A failed request is counted and otherwise treated like a dropped frame, so the stream keeps running.
+    def __init__(self, wait_ms=30, redraw_skipped=True, metrics=None):
+        self.wait = wait_ms / 1000
+        self.redraw_skipped = redraw_skipped
+        self.metrics = metrics
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.detections = None
+        self._pending = None
+
+    @property
+    def busy(self):
+        return self._pending is not None
+
+    def admit(self):
+        self.received += 1
+        if self._pending is not None and not self._collect():
+            self.dropped += 1
+            return False
+        return True
+
+    def submit(self, request):
+        # Returns the detections for this frame if they arrive within the wait budget,
+        # otherwise None and the request stays in flight for a later frame to collect.
+        self._pending = request
+        request.done.wait(self.wait)
+        if self._collect():
+            return self.detections
+        return None
+
+    def _collect(self):
+        request = self._pending
+        if not request.done.is_set():
+            return False
+        self._pending = None
+        if request.error is not None:
+            self.failed += 1
+            if self.metrics is not None:
+                self.metrics.increment("frames_failed")
+            return True
+        self.detections = request.output
+        self.processed += 1
+        return True
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "in_flight": int(self.busy),
+        }
+
+
+class ResultChannel:
+    # Fixed-size ring buffer between a stream callback and the page; the oldest results are dropped on overflow.
+    def __init__(self, maxlen=30):
+        self._items = collections.deque(maxlen=maxlen)
+        self._ready = threading.Condition()
+        self.published = 0
+        self.overwritten = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        with self._ready:
+            if len(self._items) == self._items.maxlen:
+                self.overwritten += 1
+            self._items.append(item)
+            self.published += 1
+            self._ready.notify_all()
+
+    def get(self, timeout=None):
+        with self._ready:
+            if not self._items and not self._ready.wait_for(lambda: self._items, timeout):
+                return None
+            return self._items.popleft()
+
+    def drain(self, timeout=None):
+        with self._ready:
+            if not self._items and not self._ready.wait_for(lambda: self._items, timeout):
+                return []
+            items = list(self._items)
+            self._items.clear()
+            return items
+
+    def stats(self):
+        return {"published": self.published, "overwritten": self.overwritten, "buffered": len(self._items)}
+
+
+class KeyframePolicy:
+    # Runs the detector on every `interval`-th admitted frame, or earlier when the scene has changed
+    # by more than `motion_threshold` since the last keyframe.
+    def __init__(self, motion_score, interval=1, motion_threshold=0):
+        self.motion_score = motion_score
+        self.interval = interval
+        self.motion_threshold = motion_threshold
+        self.since_keyframe = None
+
+    def due(self, image):
+        score = self.motion_score(image) if self.motion_threshold else 0.0
+        if self.since_keyframe is None or self.since_keyframe + 1 >= self.interval or score > self.motion_threshold:
+            if self.motion_threshold:
+                self.motion_score.reset()
+            self.since_keyframe = 0
+            return True
+        self.since_keyframe += 1
+        return False
+
+
+# (frame scale, detector interval multiplier, frame stride), from full quality down to the cheapest setting
+GOVERNOR_LEVELS = (
+    (1.0, 1, 1),
+    (1.0, 2, 1),
+    (0.75, 2, 1),
+    (0.5, 3, 1),
+    (0.5, 4, 2),
+)
+
+
+class LatencyGovernor:
+    # Steps a stream down GOVERNOR_LEVELS while its smoothed frame latency or the shared inference queue is
+    # over target, and back up once both have stayed well under it. Stepping up waits longer than stepping
+    # down so the level does not oscillate around the target.
+    def __init__(self, target_ms=60, max_pending=4, levels=GOVERNOR_LEVELS, smoothing=0.1, hold_frames=15, recover_frames=60, recover_ratio=0.6, metrics=None):
+        self.enabled = True
+        self.target = target_ms / 1000
+        self.max_pending = max_pending
+        self.levels = levels
+        self.smoothing = smoothing
+        self.hold_frames = hold_frames
+        self.recover_frames = recover_frames
+        self.recover_ratio = recover_ratio
+        self.metrics = metrics
+        self.level = 0
+        self.latency = 0.0
+        self.pending = 0
+        self.last_output = None
+        self._since_change = 0
+        self._frames = 0
+
+    @property
+    def scale(self):
+        return self.levels[self.level][0]
+
+    @property
+    def interval(self):
+        return self.levels[self.level][1]
+
+    @property
+    def stride(self):
+        return self.levels[self.level][2]
+
+    def frame_size(self, width, height):
+        # Even dimensions keep scaled yuv420p frames on the direct I420 -> BGR path.
+        if self.scale == 1:
+            return width, height
+        return max(2, int(width * self.scale) & ~1), max(2, int(height * self.scale) & ~1)
+
+    def admit(self):
+        # False for frames the current stride skips; the caller repeats last_output for those.
+        self._frames += 1
+        return self.last_output is None or self._frames % self.stride == 0
+
+    def observe(self, seconds, pending=0):
+        self.latency += self.smoothing * (seconds - self.latency)
+        self.pending = pending
+        self._since_change += 1
+        if not self.enabled:
+            self._set_level(0)
+        elif self.latency > self.target or pending > self.max_pending:
+            if self._since_change >= self.hold_frames and self.level < len(self.levels) - 1:
+                self._set_level(self.level + 1)
+        elif self.latency < self.target * self.recover_ratio and pending <= self.max_pending // 2:
+            if self._since_change >= self.recover_frames and self.level > 0:
+                self._set_level(self.level - 1)
+
+    def _set_level(self, level):
+        if level == self.level:
+            return
+        if self.metrics is not None:
+            self.metrics.increment("governor_downgrades" if level > self.level else "governor_upgrades")
+        self.level = level
+        self._since_change = 0
+
+    def stats(self):
+        return {
+            "level": self.level,
+            "frame_scale": self.scale,
+            "detect_every_x": self.interval,
+            "frame_stride": self.stride,
+            "latency_ms": round(self.latency * 1000, 1),
+            "target_ms": round(self.target * 1000),
+            "pending": self.pending,
+        }
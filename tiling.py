@@ -0,0 +1,129 @@
+import threading
+import time
+
+import numpy as np
+
+from boxes import nms
+
+
+def tile_grid(width, height, tile_size=300, overlap=0.25, max_tiles=7, full_frame=True):
+    # (N, 4) x0, y0, x1, y1 windows covering the frame, overlapping their neighbours by `overlap`. Of the grids
+    # that fit in max_tiles, the one with the smallest windows wins, so the forwards per frame stay bounded and
+    # a bigger budget buys finer tiles. Windows are never smaller than tile_size, the detector's input size.
+    # full_frame adds the whole frame as one more window for objects larger than a tile; it counts towards max_tiles.
+    budget = max_tiles - 1 if full_frame else max_tiles
+    best = None
+    for columns in range(1, budget + 1):
+        for rows in range(1, budget // columns + 1):
+            tile_width = min(width, max(tile_size, round(width / (columns - (columns - 1) * overlap))))
+            tile_height = min(height, max(tile_size, round(height / (rows - (rows - 1) * overlap))))
+            key = (max(tile_width, tile_height), columns * rows)
+            if best is None or key < best[0]:
+                best = key, columns, rows, tile_width, tile_height
+    windows = [np.array([[0, 0, width, height]], dtype=np.int32)] if full_frame or best is None else []
+    if best is not None and best[0][0] < max(width, height):
+        _, columns, rows, tile_width, tile_height = best
+        x0 = np.linspace(0, width - tile_width, columns).round().astype(np.int32)
+        y0 = np.linspace(0, height - tile_height, rows).round().astype(np.int32)
+        x0, y0 = (grid.reshape(-1) for grid in np.meshgrid(x0, y0))
+        windows.append(np.stack([x0, y0, x0 + tile_width, y0 + tile_height], axis=1))
+    return np.concatenate(windows)
+
+
+def merge_tile_rows(parts, windows, width, height, iou_threshold=0.45):
+    # parts: per-window (N, 7) detection rows normalised to their window -> one set of rows normalised to the
+    # frame, with duplicates from overlapping windows removed by class-aware NMS.
+    counts = [len(rows) for rows in parts]
+    if not sum(counts):
+        return np.empty((0, 7), dtype=np.float32)
+    rows = np.concatenate(parts).astype(np.float32, copy=False)
+    origin = np.repeat(windows[:, :2], counts, axis=0)
+    extent = np.repeat(windows[:, 2:] - windows[:, :2], counts, axis=0)
+    rows[:, 3:7] = (rows[:, 3:7] * np.tile(extent, 2) + np.tile(origin, 2)) / np.array([width, height, width, height], dtype=np.float32)
+    rows[:, 0] = 0
+    if len(parts) == 1:
+        return rows
+    return rows[nms(rows[:, 3:7], rows[:, 2], iou_threshold, classes=rows[:, 1])]
+
+
+class TiledRequest:
+    # Stands in for one InferenceRequest while each window runs as its own request; the scheduler batches
+    # them into one forward when they fit in max_batch. The windows are merged by whichever thread first
+    # sees them all done.
+    def __init__(self, requests, windows, width, height, iou_threshold=0.45):
+        self.requests = requests
+        self.windows = np.asarray(windows, dtype=np.int32)
+        self.width = width
+        self.height = height
+        self.iou_threshold = iou_threshold
+        self.output = None
+        self.error = None
+        self.done = _AllDone(self)
+
+    def merge(self):
+        errors = [request.error for request in self.requests if request.error is not None]
+        if errors:
+            self.error = errors[0]
+        else:
+            self.output = merge_tile_rows([request.output for request in self.requests], self.windows, self.width, self.height, self.iou_threshold)
+
+
+class _AllDone:
+    # The Event interface consumers of an InferenceRequest use, over all of a TiledRequest's windows.
+    def __init__(self, request):
+        self.request = request
+        self._set = False
+        self._lock = threading.Lock()
+
+    def is_set(self):
+        if not self._set and all(request.done.is_set() for request in self.request.requests):
+            self._finish()
+        return self._set
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for request in self.request.requests:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            if not request.done.wait(remaining):
+                return False
+        self._finish()
+        return True
+
+    def _finish(self):
+        with self._lock:
+            if not self._set:
+                self.request.merge()
+                self._set = True
+
+
+class Tiler:
+    # Per-stream tiled inference: cuts each frame into tile_grid windows and preprocesses every window
+    # at the detector's input size, so small objects keep far more pixels than in the full-frame resize.
+    def __init__(self, preprocessor, blob_shape, tile_size=300, overlap=0.25, max_tiles=7, full_frame=True, iou_threshold=0.45):
+        self.preprocess = preprocessor
+        self.blob_shape = blob_shape
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.max_tiles = max_tiles
+        self.full_frame = full_frame
+        self.iou_threshold = iou_threshold
+        self._windows = {}
+
+    def windows(self, width, height):
+        key = (width, height, self.tile_size, self.overlap, self.max_tiles, self.full_frame)
+        if key not in self._windows:
+            self._windows = {key: tile_grid(width, height, self.tile_size, self.overlap, self.max_tiles, self.full_frame)}
+        return self._windows[key]
+
+    def submit(self, scheduler, image, region=None):
+        # region: optional x0, y0, x1, y1 rectangle to tile instead of the whole frame.
+        height, width = image.shape[:2]
+        x0, y0, x1, y1 = region or (0, 0, width, height)
+        windows = self.windows(x1 - x0, y1 - y0) + np.array([x0, y0, x0, y0], dtype=np.int32)
+        requests = []
+        for x0, y0, x1, y1 in windows.tolist():
+            # A fresh blob per window: the scheduler reads it after this call returns
+            blob = np.empty((1, *self.blob_shape), dtype=np.float32)
+            self.preprocess(image[y0:y1, x0:x1], out=blob[0])
+            requests.append(scheduler.submit(blob))
+        return TiledRequest(requests, windows, width, height, self.iou_threshold)
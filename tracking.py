@@ -0,0 +1,109 @@
+import numpy as np
+
+from boxes import corners, iou_matrix
+from pipeline import DETECTION_DTYPE
+
+
+def greedy_match(iou, threshold):
+    # Pairs (row, column) in order of decreasing IoU, each row and column used at most once.
+    rows, columns = np.nonzero(iou >= threshold)
+    if not len(rows):
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    order = np.argsort(-iou[rows, columns], kind="stable")
+    matched_rows, matched_columns = [], []
+    used_rows, used_columns = set(), set()
+    for row, column in zip(rows[order].tolist(), columns[order].tolist()):
+        if row not in used_rows and column not in used_columns:
+            used_rows.add(row)
+            used_columns.add(column)
+            matched_rows.append(row)
+            matched_columns.append(column)
+    return np.array(matched_rows, dtype=np.intp), np.array(matched_columns, dtype=np.intp)
+
+
+class Tracker:
+    # Persistent track IDs over keyframe detections. Tracks are matched within a class by IoU against
+    # their predicted boxes, smoothed with an alpha-beta filter, coast on their velocity between keyframes
+    # and through missed detections, and are dropped after more than `max_missed` missed keyframes.
+    # Past `max_coast` frames without a keyframe, tracks stay where they are rather than run off on a stale velocity.
+    def __init__(self, iou_threshold=0.3, max_missed=5, alpha=0.6, beta=0.2, max_coast=10):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.max_coast = max_coast
+        self.alpha = alpha
+        self.beta = beta
+        self.ids = np.empty(0, dtype=np.int32)
+        self.class_ids = np.empty(0, dtype=np.int32)
+        self.scores = np.empty(0, dtype=np.float32)
+        self.corners = np.empty((0, 4), dtype=np.float32)
+        self.velocity = np.empty((0, 4), dtype=np.float32)
+        self.missed = np.empty(0, dtype=np.int32)
+        self.boxes = None
+        self.size = None
+        self.age = 0
+        self.generation = 0
+        self._next_id = 1
+
+    def resize(self, width, height):
+        # Keeps tracks in the coordinates of the frames they are drawn on when the stream resolution changes.
+        if self.size is not None and self.size != (width, height):
+            factor = np.array([width / self.size[0], height / self.size[1]] * 2, dtype=np.float32)
+            self.corners *= factor
+            self.velocity *= factor
+            if self.boxes is not None:
+                self.boxes = self._output()
+        self.size = (width, height)
+
+    def update(self, detections, generation=0):
+        # generation identifies the detection result the boxes were decoded from.
+        dt = self.age + 1
+        predicted = self.corners + self.velocity
+        measured = corners(detections).astype(np.float32)
+        iou = iou_matrix(predicted, measured)
+        iou[self.class_ids[:, None] != detections["class_id"][None, :]] = 0
+        tracks, matches = greedy_match(iou, self.iou_threshold)
+
+        residual = measured[matches] - predicted[tracks]
+        self.corners = predicted
+        self.corners[tracks] += self.alpha * residual
+        self.velocity[tracks] += self.beta * residual / dt
+        self.scores[tracks] += self.alpha * (detections["score"][matches] - self.scores[tracks])
+        self.missed += 1
+        self.missed[tracks] = 0
+
+        keep = self.missed <= self.max_missed
+        new = np.ones(len(detections), dtype=bool)
+        new[matches] = False
+        count = int(new.sum())
+        self.ids = np.concatenate([self.ids[keep], np.arange(self._next_id, self._next_id + count, dtype=np.int32)])
+        self._next_id += count
+        self.class_ids = np.concatenate([self.class_ids[keep], detections["class_id"][new]])
+        self.scores = np.concatenate([self.scores[keep], detections["score"][new]])
+        self.corners = np.concatenate([self.corners[keep], measured[new]])
+        self.velocity = np.concatenate([self.velocity[keep], np.zeros((count, 4), dtype=np.float32)])
+        self.missed = np.concatenate([self.missed[keep], np.zeros(count, dtype=np.int32)])
+        self.age = 0
+        self.generation = generation
+        self.boxes = self._output()
+        return self.boxes
+
+    def hold(self):
+        # The scene has not changed: keep the tracks where they are instead of extrapolating their velocity.
+        self.velocity[:] = 0
+
+    def predict(self):
+        if self.boxes is None:
+            return None
+        self.age += 1
+        if self.age <= self.max_coast:
+            self.corners += self.velocity
+        self.boxes = self._output()
+        return self.boxes
+
+    def _output(self):
+        boxes = np.empty(len(self.ids), dtype=DETECTION_DTYPE)
+        boxes["class_id"] = self.class_ids
+        boxes["score"] = self.scores
+        corners(boxes)[:] = self.corners
+        boxes["track_id"] = self.ids
+        return boxes
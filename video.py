@@ -0,0 +1,253 @@
+import argparse
+import collections
+import json
+import os
+import queue
+import threading
+import time
+from fractions import Fraction
+
+import av
+import numpy as np
+
+from backends import BACKENDS, compute_options, get_backend
+from batch import ResultWriter
+from detector import DetectorPool, InferenceScheduler
+from pipeline import CLASSES, DetectionRenderer, decode_detections, label_colors, to_detections
+
+_DONE = object()
+MILLISECONDS = Fraction(1, 1000)
+
+
+class _Failure:
+    __slots__ = ("error",)
+
+    def __init__(self, error):
+        self.error = error
+
+
+def threaded(stage, maxsize=8, name="video-stage"):
+    # Runs a generator stage on its own thread and hands its items over through a bounded queue,
+    # so neighbouring stages overlap while a slow consumer still holds back the producer.
+    items = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run():
+        try:
+            for item in stage:
+                if not put(item):
+                    return
+        except BaseException as exc:
+            put(_Failure(exc))
+        finally:
+            put(_DONE)
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class VideoFrames:
+    # Demuxes and decodes the first video stream, yielding (index, seconds, image) for every `stride`-th frame.
+    # keyframes_only asks the decoder to skip everything but keyframes, the fastest way to skim a long video.
+    def __init__(self, path, stride=1, keyframes_only=False):
+        self.container = av.open(path)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        if keyframes_only:
+            self.stream.codec_context.skip_frame = "NONKEY"
+        self.stride = stride
+        self.decoded = 0
+
+    @property
+    def rate(self):
+        return self.stream.average_rate or Fraction(30)
+
+    @property
+    def duration(self):
+        if self.stream.duration is not None:
+            return float(self.stream.duration * self.stream.time_base)
+        if self.container.duration is not None:
+            return self.container.duration / av.time_base
+        return None
+
+    def __iter__(self):
+        try:
+            for index, frame in enumerate(self.container.decode(self.stream)):
+                self.decoded += 1
+                if index % self.stride == 0:
+                    yield index, frame.time, frame.to_ndarray(format="bgr24")
+        finally:
+            self.container.close()
+
+
+def detect(frames, scheduler, preprocessor, blob_shape, window=16):
+    # Keeps up to `window` frames in flight so the scheduler can batch them; yields (index, seconds, image, rows) in order.
+    preprocess = preprocessor()
+    in_flight = collections.deque()
+    for index, seconds, image in frames:
+        blob = np.empty((1, *blob_shape), dtype=np.float32)
+        preprocess(image, out=blob[0])
+        in_flight.append((index, seconds, image, scheduler.submit(blob)))
+        if len(in_flight) >= window:
+            yield _collect(*in_flight.popleft())
+    while in_flight:
+        yield _collect(*in_flight.popleft())
+
+
+def _collect(index, seconds, image, request):
+    request.done.wait()
+    if request.error is not None:
+        raise request.error
+    return index, seconds, image, request.output
+
+
+def annotate(detections, threshold, renderer=None):
+    # Yields (index, seconds, image, boxes); boxes are drawn onto the image when a renderer is given.
+    for index, seconds, image, rows in detections:
+        height, width = image.shape[:2]
+        boxes = decode_detections(rows, width, height, threshold)
+        if renderer is not None:
+            renderer.draw(image, boxes)
+        yield index, seconds, image, boxes
+
+
+class VideoWriter:
+    # timestamps places each frame at the source time passed to write(), for inputs without a fixed frame spacing.
+    def __init__(self, path, rate, codec="libx264", timestamps=False):
+        self.container = av.open(path, "w")
+        self.stream = self.container.add_stream(codec, rate=rate)
+        self.stream.pix_fmt = "yuv420p"
+        self.timestamps = timestamps
+        if timestamps:
+            self.stream.codec_context.time_base = MILLISECONDS
+        self.written = 0
+
+    def write(self, image, seconds=None):
+        if not self.written:
+            self.stream.height, self.stream.width = image.shape[0] & ~1, image.shape[1] & ~1
+        frame = av.VideoFrame.from_ndarray(image, format="bgr24")
+        if self.timestamps and seconds is not None:
+            frame.pts = round(seconds * 1000)
+            frame.time_base = MILLISECONDS
+        for packet in self.stream.encode(frame):
+            self.container.mux(packet)
+        self.written += 1
+
+    def close(self):
+        for packet in self.stream.encode():
+            self.container.mux(packet)
+        self.container.close()
+
+
+def process_video(path, scheduler, preprocessor, blob_shape, output=None, detections=None, threshold=0.5, labels=CLASSES, renderer=None, stride=1, keyframes_only=False, codec="libx264", queue_size=8):
+    # decode -> detect -> annotate -> encode, each on its own thread with bounded queues in between.
+    frames = VideoFrames(path, stride, keyframes_only)
+    rate = frames.rate / stride
+    duration = frames.duration
+    # Keyframes are unevenly spaced, so a skim keeps their source times instead of a fixed output rate
+    writer = VideoWriter(output, rate, codec, timestamps=keyframes_only) if output else None
+    stages = threaded(frames, queue_size, "video-decode")
+    stages = threaded(detect(stages, scheduler, preprocessor, blob_shape, window=queue_size * 2), queue_size, "video-detect")
+    stages = annotate(stages, threshold, renderer if writer else None)
+    processed = 0
+    start = time.perf_counter()
+    try:
+        for index, seconds, image, boxes in stages:
+            if writer is not None:
+                writer.write(image, seconds)
+            if detections is not None:
+                detections.write({
+                    "frame": index,
+                    "time": round(seconds, 3) if seconds is not None else None,
+                    "detections": [
+                        {"label": detection.label, "class_id": detection.class_id, "score": round(detection.score, 4), "box": detection.box.tolist()}
+                        for detection in to_detections(boxes, labels)
+                    ],
+                })
+            processed += 1
+    finally:
+        if writer is not None:
+            writer.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "input": path,
+        "output": output,
+        "frames_decoded": frames.decoded,
+        "frames_processed": processed,
+        "stride": stride,
+        "keyframes_only": keyframes_only,
+        "seconds": round(elapsed, 3),
+        "fps": round(processed / elapsed, 2) if elapsed else None,
+        "decode_fps": round(frames.decoded / elapsed, 2) if elapsed else None,
+        "video_seconds": round(duration, 3) if duration is not None else None,
+        "speed": round(duration / elapsed, 2) if duration and elapsed else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the object detector over a video file and optionally write an annotated copy.")
+    parser.add_argument("input", help="video file, e.g. an MP4")
+    parser.add_argument("--output", help="annotated video to write")
+    parser.add_argument("--detections", help="also write per-frame detections as JSON lines to this file")
+    parser.add_argument("--stride", type=int, default=1, help="process every Nth frame; the output plays at the reduced rate")
+    parser.add_argument("--keyframes-only", action="store_true", help="decode keyframes only, for a quick summary of a long video; the output keeps their source times")
+    parser.add_argument("--codec", default="libx264", help="encoder for --output")
+    parser.add_argument("--detector", choices=tuple(BACKENDS), default="caffe-ssd", help="registered detector backend")
+    parser.add_argument("--compute", choices=tuple(compute_options()), default="OpenCV / CPU", help="OpenCV DNN backend / target")
+    parser.add_argument("--threshold", type=float, default=0.5, help="minimum detection score")
+    parser.add_argument("--backend", choices=("thread", "process"), default="thread", help="run forward passes on a thread pool or in worker processes")
+    parser.add_argument("--pool-size", type=int, default=2, help="nets in the thread backend pool")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes for the process backend")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--queue-size", type=int, default=8, help="frames buffered between stages")
+    args = parser.parse_args(argv)
+    if args.stride < 1:
+        parser.error("--stride must be at least 1")
+
+    detector = get_backend(args.detector).on(*compute_options()[args.compute])
+    if args.backend == "process":
+        from process_scheduler import ProcessScheduler
+
+        scheduler = ProcessScheduler(detector, workers=args.workers, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    else:
+        scheduler = InferenceScheduler(DetectorPool(detector, size=args.pool_size), max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    renderer = DetectionRenderer(label_colors(len(detector.labels)), detector.labels)
+    stream = open(args.detections, "w") if args.detections else None
+    try:
+        # process_video times from its first frame, so loading and warm-up stay out of the reported fps
+        scheduler.wait_ready()
+        report = process_video(
+            args.input, scheduler, detector.preprocessor, detector.blob_shape, output=args.output,
+            detections=ResultWriter(stream) if stream else None, threshold=args.threshold, labels=detector.labels,
+            renderer=renderer, stride=args.stride, keyframes_only=args.keyframes_only, codec=args.codec, queue_size=args.queue_size,
+        )
+    finally:
+        scheduler.close()
+        if stream is not None:
+            stream.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()